@@ -0,0 +1,39 @@
+import argparse, asyncio, time
+from benchmarks.mock_servers import FakeOpenAIHandler, StubEncoding, start_server
+from utils.analyzer import AsyncGPTWrapper
+from utils.rate_limit import RateLimiter
+
+# Many concurrent analyses through AsyncGPTWrapper against the local fake OpenAI server,
+# which answers 429 + Retry-After to every n-th request; --runs > 1 reuses the wrapper in a new event loop
+
+def main():
+    parser = argparse.ArgumentParser(description='Run concurrent analyses against a fake OpenAI endpoint.')
+    parser.add_argument('--apps', type=int, default=20)
+    parser.add_argument('--rpm', type=float, default=600, help='Requests per minute limit on the client side')
+    parser.add_argument('--tpm', type=float, default=1000000, help='Tokens per minute limit on the client side')
+    parser.add_argument('--rate_limit_every', type=int, default=5, help='Server answers 429 to every n-th request')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--runs', type=int, default=2, help='asyncio.run() calls with the same wrapper, like a long lived client')
+    args = parser.parse_args()
+
+    server, base = start_server(FakeOpenAIHandler, latency=0.2, rate_limit_every=args.rate_limit_every, retry_after=1)
+    gpt = AsyncGPTWrapper(api_key="fake", model="gpt-4.1-mini", base_url=f"{base}/v1",
+                          max_concurrency=args.concurrency, rate_limiter=RateLimiter(args.rpm, args.tpm))
+    gpt._enc = StubEncoding() # no tiktoken table download
+    reviews = [{"rating": 5, "app_version": "1.0", "title": f"Review {i}", "content": "Works well " * 20} for i in range(50)]
+
+    async def run(run_number):
+        return await asyncio.gather(*(gpt.process_reviews({"name": f"App {run_number}.{i}"}, reviews) for i in range(args.apps)))
+
+    handler = server.RequestHandlerClass
+    for run_number in range(args.runs):
+        start = time.perf_counter()
+        results = asyncio.run(run(run_number))
+        elapsed = time.perf_counter() - start
+        assert all(result["app_analysis"]["name"] == f"App {run_number}.{i}" for i, result in enumerate(results))
+        print(f"Run {run_number + 1}: {len(results)} analyses in {elapsed:.2f}s; server requests: {handler.requests_seen}, "
+              f"429 answers: {handler.rate_limited}, client retries: {gpt.retries}")
+    server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+import argparse, time
+from benchmarks.mock_servers import MockRSSHandler, start_server
+from utils.load_reviews import load_ios_reviews
+
+# Sequential vs concurrent App Store review fetching against the local mock RSS server
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare sequential and concurrent review fetching.')
+    parser.add_argument('--latency', type=float, default=0.05, help='Mock server delay per request, seconds')
+    parser.add_argument('--stores', type=str, default="us,ca,au,ru,it,in,fr,gb,ua,jp,cn,tw,my,de,kr,br,mx,es,sa,ae,vn,tr")
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    server, base = start_server(MockRSSHandler, latency=args.latency)
+    base_url = base + "/{store}/rss/customerreviews"
+    stores = args.stores.split(",")
+
+    start = time.perf_counter()
+    sequential = load_ios_reviews("123456789", stores=stores, max_workers=1, base_url=base_url)
+    sequential_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    concurrent = load_ios_reviews("123456789", stores=stores, max_workers=args.workers, base_url=base_url)
+    concurrent_time = time.perf_counter() - start
+    server.shutdown()
+
+    assert sequential == concurrent, "Concurrent fetch result differs from sequential"
+    print(f"{len(sequential)} reviews from {len(stores)} stores")
+    print(f"sequential: {sequential_time:.2f}s; concurrent: {concurrent_time:.2f}s; speedup x{sequential_time / concurrent_time:.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+import argparse, glob, json, os, platform, statistics, subprocess, sys, tempfile, time
+from functools import partial
+from benchmarks.mock_servers import FakeOpenAIHandler, MockPageHandler, MockRSSHandler, StubEncoding, make_rss_page, start_server
+from benchmarks.record_fixtures import FIXTURES_FOLDER
+from utils import load_app_info, load_reviews, pipeline, sensortower
+from utils.analyzer import GPTWrapper
+from utils.create_html import create_html
+from utils.load_app_info import load_ios_app_info, load_ios_app_infos
+from utils.itunes_feed import loads
+from utils.load_reviews import load_ios_reviews, process_response
+from utils.metrics import metrics
+from utils.review_table import ReviewTable
+from utils.sensortower import _get_revenue_and_downloads, get_revenue_and_downloads
+
+# Reproducible benchmarks without network: recorded RSS fixtures, mock iTunes server, fake OpenAI endpoint.
+#   python -m benchmarks.bench_suite --output temp/bench/new.json --compare temp/bench/old.json
+# Every benchmark runs --repeat times, best and median seconds go to the JSON file.
+
+BENCHMARKS = ("decode_response", "process_response", "sensortower_meta", "select", "create_html", "end_to_end")
+
+def make_reviews(count: int, stores=("us", "gb", "ca", "au", "de")) -> list:
+    # review dicts as the iOS loader returns them
+    reviews = []
+    page = 1
+    while len(reviews) < count:
+        for store in stores:
+            for review in process_response(make_rss_page(store, "123456789", page, last_page=page)):
+                review["store"] = store
+                reviews.append(review)
+        page += 1
+    return reviews[:count]
+
+def pipeline_args(save_folder, **overrides) -> argparse.Namespace:
+    # review_analyzer.py defaults for the options pipeline stages read
+    values = dict(stores=["us", "gb"], android_pages=10, no_dedup=False, near_duplicates=False, save_folder=save_folder,
+                  no_browser=True, export_folder=None, export_format="jsonl", max_input_tokens=None,
+                  selection="longest", max_reviews=None, incremental=False, cluster=False, max_clusters=50,
+                  reserve_output_tokens=4096, map_reduce=False, max_gpt_concurrency=4, workers=4)
+    values.update(overrides)
+    return argparse.Namespace(**values)
+
+def make_gpt(args, **kwargs) -> GPTWrapper:
+    # token counts by StubEncoding unless --tiktoken, which needs the BPE table (network or TIKTOKEN_CACHE_DIR)
+    gpt = GPTWrapper(api_key="fake", model="gpt-4.1-mini", **kwargs)
+    if not args.tiktoken: gpt._enc = StubEncoding()
+    return gpt
+
+def measure(function, repeat: int) -> list:
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        runs.append(time.perf_counter() - start)
+    return runs
+
+def _quiet(function):
+    # stages print a lot and show progress bars, benchmarks should only print results
+    def run():
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout = sys.stderr = open(os.devnull, "w")
+        try:
+            return function()
+        finally:
+            sys.stdout.close()
+            sys.stdout, sys.stderr = stdout, stderr
+    return run
+
+def load_fixtures() -> list:
+    # raw bytes of the recorded RSS pages
+    pages = []
+    for path in sorted(glob.glob(os.path.join(FIXTURES_FOLDER, "rss_*.json"))):
+        with open(path, "rb") as file:
+            pages.append(file.read())
+    if not pages:
+        raise RuntimeError(f"No RSS fixtures in {FIXTURES_FOLDER}; run python -m benchmarks.record_fixtures")
+    return pages
+
+def bench_decode_response(args):
+    raw_pages = load_fixtures()
+    loops = max(1, args.parse_pages // len(raw_pages))
+
+    def run():
+        for _ in range(loops):
+            for raw in raw_pages:
+                loads(raw)
+    yield {"pages": loops * len(raw_pages)}, loops * len(raw_pages), run
+
+def bench_process_response(args):
+    pages = [json.loads(raw) for raw in load_fixtures()]
+    loops = max(1, args.parse_pages // len(pages))
+    items = sum(len(process_response(page)) for page in pages) * loops
+
+    def run():
+        for _ in range(loops):
+            for page in pages:
+                process_response(page)
+    yield {"pages": loops * len(pages)}, items, run
+
+def bench_sensortower_meta(args):
+    # saved overview pages; fails if the extracted values differ from sensortower_expected.json
+    with open(os.path.join(FIXTURES_FOLDER, "sensortower_expected.json")) as file:
+        expected = json.load(file)
+    pages = {}
+    for name, values in expected.items():
+        with open(os.path.join(FIXTURES_FOLDER, name), encoding="utf-8") as file:
+            pages[name] = file.read()
+        revenue, downloads = _get_revenue_and_downloads(pages[name])
+        if {"revenue": revenue, "downloads": downloads} != values:
+            raise RuntimeError(f"{name}: got revenue {revenue}, downloads {downloads}; expected {values}")
+    check_sensortower_streaming(pages, expected)
+    loops = max(1, args.parse_pages // len(pages))
+
+    def run():
+        for _ in range(loops):
+            for html in pages.values():
+                _get_revenue_and_downloads(html)
+    yield {"pages": loops * len(pages)}, loops * len(pages), run
+
+def check_sensortower_streaming(pages: dict, expected: dict, padding: int = 4 * 1024 * 1024):
+    # the same pages with a big body from a local server: values must match and the download must stop after <head>
+    server, base = start_server(MockPageHandler, pages={name: html.encode("utf-8") for name, html in pages.items()}, padding=padding)
+    try:
+        for name, values in expected.items():
+            metrics.reset()
+            result = get_revenue_and_downloads(name, base_url=base + "/overview")
+            read = sum(counter["value"] for counter in metrics.to_dict()["counters"] if counter["name"] == "http_bytes")
+            want = {"downloads": values["downloads"] or "-", "revenue": values["revenue"] or "-"}
+            if result != want:
+                raise RuntimeError(f"{name} streamed: got {result}; expected {want}")
+            if read > padding // 10:
+                raise RuntimeError(f"{name} streamed: read {read} bytes of a {len(pages[name]) + padding} bytes page")
+    finally:
+        server.shutdown()
+        metrics.reset()
+
+def bench_select(args, gpt):
+    app_info = {"name": "Bench App", "icon": "", "screenshots": [], "description": "", "rating": 4.5}
+    for size in args.sizes:
+        reviews = make_reviews(size)
+        for selection in ("longest", "stratified"):
+            run_args = pipeline_args(None, selection=selection)
+            yield ({"reviews": size, "selection": selection}, size,
+                   _quiet(partial(pipeline.select_stage, app_info, reviews, gpt, run_args)))
+
+def bench_create_html(args):
+    folder = tempfile.mkdtemp(prefix="bench_html_")
+    analysis = {"name": "Bench App", "pros": ["Easy to use"] * 5, "cons": ["Crashes"] * 5,
+                "suggest_what_improve": "Fix crashes", "why_app_popular": "Simple"}
+    app_info = {"name": "Bench App", "icon": "", "screenshots": [], "update": "2024-05-01", "release": "2020-01-01",
+                "rating": 4.5, "rating_count": 1234}
+    sensortower_info = {"downloads": "-", "revenue": "-"}
+    for size in args.sizes:
+        reviews = ReviewTable.from_dicts(make_reviews(size)).view()
+        path = os.path.join(folder, f"report_{size}.html")
+        yield {"reviews": size}, size, _quiet(partial(create_html, analysis, app_info, reviews, sensortower_info, path,
+                                                      open_html_page=False, app_id="123456789", is_appstore=True))
+
+def bench_end_to_end(args):
+    rss_server, rss_base = start_server(MockRSSHandler, latency=args.rss_latency, last_page=args.pages)
+    gpt_server, gpt_base = start_server(FakeOpenAIHandler, latency=args.gpt_latency)
+    folder = tempfile.mkdtemp(prefix="bench_e2e_")
+    app_ids = [str(100000000 + i) for i in range(args.apps)]
+    run_args = pipeline_args(folder, stores=args.stores.split(","), workers=args.workers)
+    gpt = make_gpt(args, base_url=f"{gpt_base}/v1", max_concurrency=args.workers)
+
+    # pipeline stages import the loaders when they run and call them with production URLs, point them at the mocks
+    originals = (load_reviews.load_ios_reviews, load_app_info.load_ios_app_info, load_app_info.load_ios_app_infos,
+                 sensortower.get_revenue_and_downloads)
+    load_reviews.load_ios_reviews = partial(load_ios_reviews, base_url=rss_base + "/{store}/rss/customerreviews")
+    load_app_info.load_ios_app_info = partial(load_ios_app_info, base_url=rss_base + "/lookup")
+    load_app_info.load_ios_app_infos = partial(load_ios_app_infos, base_url=rss_base + "/lookup")
+    sensortower.get_revenue_and_downloads = lambda app_id: {"downloads": "-", "revenue": "-"}
+
+    def run():
+        metrics.reset()
+        results = pipeline.run_apps(app_ids, run_args, gpt)
+        failed = [app_id for app_id, result in results.items() if result["status"] != "done"]
+        if failed: raise RuntimeError(f"End to end run failed for: {', '.join(failed)}")
+    try:
+        items = args.apps * len(run_args.stores) * args.pages * 50
+        yield {"apps": args.apps, "stores": len(run_args.stores), "pages": args.pages}, items, _quiet(run)
+    finally:
+        (load_reviews.load_ios_reviews, load_app_info.load_ios_app_info, load_app_info.load_ios_app_infos,
+         sensortower.get_revenue_and_downloads) = originals
+        rss_server.shutdown()
+        gpt_server.shutdown()
+
+def result_key(result) -> str:
+    params = ",".join(f"{key}={value}" for key, value in sorted(result["params"].items()))
+    return f"{result['name']}[{params}]"
+
+def compare(results: list, baseline_path: str, threshold: float) -> list:
+    # prints best time ratios against a previous results file; returns regressed benchmark keys
+    with open(baseline_path) as file:
+        baseline = {result_key(result): result for result in json.load(file)["results"]}
+    regressions = []
+    print(f"\nCompared with {baseline_path} (best seconds):")
+    for result in results:
+        key = result_key(result)
+        old = baseline.get(key)
+        if not old:
+            print(f"  {key}: {result['best']:.4f}s (new)")
+            continue
+        ratio = result["best"] / old["best"] if old["best"] else float("inf")
+        mark = ""
+        if ratio > 1 + threshold:
+            mark = "  REGRESSION"
+            regressions.append(key)
+        print(f"  {key}: {old['best']:.4f}s -> {result['best']:.4f}s (x{ratio:.2f}){mark}")
+    return regressions
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip()
+    except OSError:
+        return ""
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the benchmark suite and save results to JSON.')
+    parser.add_argument('--only', type=str, default=",".join(BENCHMARKS), help=f'Comma separated: {", ".join(BENCHMARKS)}')
+    parser.add_argument('--sizes', type=str, default="1000,10000,100000", help='Review counts for select and create_html')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--parse_pages', type=int, default=2000, help='RSS pages parsed per process_response run')
+    parser.add_argument('--apps', type=int, default=4, help='End to end: apps per run')
+    parser.add_argument('--stores', type=str, default="us,gb,ca,au", help='End to end: stores per app')
+    parser.add_argument('--pages', type=int, default=10, help='End to end: RSS pages per store')
+    parser.add_argument('--workers', type=int, default=4, help='End to end: apps processed at the same time')
+    parser.add_argument('--rss_latency', type=float, default=0.01, help='Mock iTunes delay per request, seconds')
+    parser.add_argument('--gpt_latency', type=float, default=0.2, help='Fake OpenAI delay per request, seconds')
+    parser.add_argument('--tiktoken', action='store_true', help='Count tokens with the real tiktoken table instead of a stub (downloads it unless cached)')
+    parser.add_argument('--output', type=str, default=None, help='Results JSON; default: temp/bench/bench_<commit>_<time>.json')
+    parser.add_argument('--compare', type=str, default=None, help='Previous results JSON to compare with')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Slowdown ratio reported as a regression')
+    args = parser.parse_args()
+    args.sizes = [int(size) for size in args.sizes.split(",") if size]
+
+    names = [name.strip() for name in args.only.split(",") if name.strip()]
+    unknown = set(names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"Unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    cases = {"decode_response": lambda: bench_decode_response(args),
+             "process_response": lambda: bench_process_response(args),
+             "sensortower_meta": lambda: bench_sensortower_meta(args),
+             "select": lambda: bench_select(args, make_gpt(args)),
+             "create_html": lambda: bench_create_html(args),
+             "end_to_end": lambda: bench_end_to_end(args)}
+    results = []
+    for name in names:
+        for params, items, function in cases[name]():
+            runs = measure(function, args.repeat)
+            best = min(runs)
+            result = {"name": name, "params": params, "items": items, "runs": [round(run, 6) for run in runs],
+                      "best": round(best, 6), "median": round(statistics.median(runs), 6),
+                      "items_per_second": round(items / best, 1) if best else None}
+            results.append(result)
+            print(f"{result_key(result)}: best {best:.4f}s, median {result['median']:.4f}s, {result['items_per_second']} items/s")
+
+    commit = git_commit()
+    output = args.output or os.path.join("temp", "bench", f"bench_{commit or 'local'}_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as file:
+        json.dump({"commit": commit, "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+                   "platform": platform.platform(), "repeat": args.repeat, "results": results}, file, indent=2)
+    print(f"Results saved to: {output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) over {args.threshold:.0%}")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+import hashlib, json, random, re, threading, time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+# Local stand-ins for the remote services, so fetching can be measured without network noise.
+# Run from the repo root: python -m benchmarks.bench_fetch
+
+class StubEncoding:
+    # tiktoken stand-in: the real cl100k_base table is downloaded on first use;
+    # words and punctuation as tokens are close enough for budgets and timings
+    _pattern = re.compile(r"\w+|[^\w\s]")
+
+    def encode(self, text: str, disallowed_special=()) -> list:
+        return self._pattern.findall(text)
+
+    def encode_batch(self, texts: list, disallowed_special=()) -> list:
+        return [self._pattern.findall(text) for text in texts]
+
+def make_rss_entry(rnd: random.Random, store: str, page: int, index: int) -> dict:
+    vote_count = rnd.randint(0, 5)
+    return {
+        "author": {"uri": {"label": f"https://itunes.apple.com/{store}/reviews/id{index}"},
+                   "name": {"label": f"user_{store}_{page}_{index}"}, "label": ""},
+        "updated": {"label": f"2024-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}T10:00:00-07:00"},
+        "im:rating": {"label": str(rnd.randint(1, 5))},
+        "im:version": {"label": f"1.{rnd.randint(0, 9)}.{rnd.randint(0, 9)}"},
+        "id": {"label": str(10**9 + page * 1000 + index)},
+        "title": {"label": f"Review {page}-{index}"},
+        "content": {"label": " ".join(rnd.choice(["great", "app", "crash", "love", "slow", "update", "works"])
+                                      for _ in range(rnd.randint(5, 60))),
+                    "attributes": {"type": "text"}},
+        "im:voteSum": {"label": str(rnd.randint(0, vote_count))},
+        "im:voteCount": {"label": str(vote_count)},
+    }
+
+def make_rss_page(store: str, app_id: str, page: int, last_page: int, per_page: int = 50) -> dict:
+    def link(rel, number):
+        return {"attributes": {"rel": rel, "href": f"https://itunes.apple.com/{store}/rss/customerreviews/page={number}/id={app_id}/sortby=mostrecent/xml?urlDesc=/customerreviews/id={app_id}/sortby=mostrecent/json"}}
+
+    feed = {"author": {"name": {"label": "iTunes Store"}, "uri": {"label": "http://www.apple.com/uk/itunes/"}},
+            "link": [link("first", 1), link("last", last_page),
+                     link("previous", max(page - 1, 1)), link("next", min(page + 1, last_page))]}
+    if page <= last_page:
+        rnd = random.Random(f"{store}/{app_id}/{page}")
+        feed["entry"] = [make_rss_entry(rnd, store, page, i) for i in range(per_page)]
+    return {"feed": feed}
+
+
+def make_lookup_result(app_ids: list) -> dict:
+    # iTunes lookup API answer, ids that do not start with "9" are found
+    results = [{
+        "trackId": int(app_id), "trackName": f"Mock App {app_id}", "description": "Mock app for benchmarks.",
+        "releaseNotes": "Bug fixes", "artworkUrl512": "https://example.com/icon.png",
+        "screenshotUrls": ["https://example.com/screen1.png", "https://example.com/screen2.png"],
+        "releaseDate": "2020-01-01T08:00:00Z", "currentVersionReleaseDate": "2024-05-01T08:00:00Z",
+        "averageUserRatingForCurrentVersion": 4.5, "userRatingCountForCurrentVersion": 1234}
+        for app_id in app_ids if not app_id.startswith("9")]
+    return {"resultCount": len(results), "results": results}
+
+
+class MockRSSHandler(BaseHTTPRequestHandler):
+    # /{store}/rss/customerreviews/page={n}/id={app_id}/sortby=mostrecent/json
+    # /lookup?id={app_id}&country={store}
+    latency = 0.05
+    last_page = 10
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        if self.path.startswith("/lookup"):
+            query = parse_qs(urlparse(self.path).query)
+            body = json.dumps(make_lookup_result(query["id"][0].split(","))).encode()
+            etag = f'"{hashlib.sha1(body).hexdigest()}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            self._send_body(body, {"ETag": etag})
+            return
+        parts = self.path.strip("/").split("/")
+        try:
+            store = parts[0]
+            page = int(parts[3].split("=")[1])
+            app_id = parts[4].split("=")[1]
+        except (IndexError, ValueError):
+            self.send_error(404)
+            return
+        self._send_body(json.dumps(make_rss_page(store, app_id, page, self.last_page)).encode())
+
+    def _send_body(self, body, headers={}):
+        self.send_response(200)
+        for name, value in headers.items(): self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockPageHandler(BaseHTTPRequestHandler):
+    # /overview/{name}: `pages[name]` with `padding` bytes of markup added to its body, like the big SensorTower pages
+    pages = {}
+    padding = 4 * 1024 * 1024
+
+    def do_GET(self):
+        name = urlparse(self.path).path.rsplit("/", 1)[-1]
+        page = self.pages.get(name)
+        if page is None:
+            self.send_error(404)
+            return
+        end = page.rfind(b"</body>")
+        if end < 0: end = len(page)
+        filler = b"<p>" + b"x" * 1017 + b"</p>\n"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(page) + self.padding // len(filler) * len(filler)))
+        self.end_headers()
+        try:
+            self.wfile.write(page[:end])
+            for _ in range(self.padding // len(filler)):
+                self.wfile.write(filler)
+            self.wfile.write(page[end:])
+        except (BrokenPipeError, ConnectionResetError):
+            pass # the client stops reading after <head>
+
+    def log_message(self, format, *args):
+        pass
+
+def start_server(handler_class, **handler_attrs):
+    # returns (server, base "http://127.0.0.1:port"), server runs in a daemon thread
+    handler = type(handler_class.__name__, (handler_class,), handler_attrs)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    # POST /v1/chat/completions, OpenAI compatible; every `rate_limit_every`-th request gets 429 + Retry-After
+    latency = 0.2
+    rate_limit_every = 0
+    retry_after = 1
+    requests_seen = 0
+    rate_limited = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        cls = type(self)
+        with cls.lock:
+            cls.requests_seen += 1
+            number = cls.requests_seen
+            limited = self.rate_limit_every and number % self.rate_limit_every == 0
+            if limited: cls.rate_limited += 1
+
+        if limited:
+            self._send_json(429, {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                            {"Retry-After": str(self.retry_after)})
+            return
+
+        time.sleep(self.latency)
+        payload = json.loads(body["messages"][-1]["content"])
+        name = payload.get("app", {}).get("name", "app")
+        content = json.dumps({"app_analysis": {"name": name, "pros": ["Easy to use"], "cons": ["Crashes"],
+                                               "suggest_what_improve": "Fix crashes", "why_app_popular": "Simple"}})
+        prompt_tokens = sum(len(message["content"]) for message in body["messages"]) // 4
+        completion_tokens = len(content) // 4
+        self._send_json(200, {
+            "id": f"chatcmpl-{number}", "object": "chat.completion", "created": int(time.time()), "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        })
+
+    def _send_json(self, status, data, headers={}):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
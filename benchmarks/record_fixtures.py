@@ -0,0 +1,34 @@
+import argparse, json, os
+from benchmarks.mock_servers import make_rss_page
+from utils.load_reviews import ITUNES_RSS_URL, fetch
+
+# Saves App Store RSS pages as fixtures for benchmarks/bench_suite.py:
+#   python -m benchmarks.record_fixtures --app_id 1460032075 --stores us,gb --pages 2
+# --synthetic writes pages from the mock generator instead (same feed shape, no network)
+
+FIXTURES_FOLDER = os.path.join(os.path.dirname(__file__), "fixtures")
+
+def main():
+    parser = argparse.ArgumentParser(description='Record App Store RSS pages as benchmark fixtures.')
+    parser.add_argument('--app_id', type=str, default="1460032075")
+    parser.add_argument('--stores', type=str, default="us,gb")
+    parser.add_argument('--pages', type=int, default=2)
+    parser.add_argument('--synthetic', action='store_true', help='Generate pages instead of downloading them')
+    parser.add_argument('--folder', type=str, default=FIXTURES_FOLDER)
+    args = parser.parse_args()
+
+    os.makedirs(args.folder, exist_ok=True)
+    for store in args.stores.split(","):
+        for page in range(1, args.pages + 1):
+            if args.synthetic:
+                data = make_rss_page(store, args.app_id, page, last_page=args.pages)
+            else:
+                data = fetch(ITUNES_RSS_URL.format(store=store) + f"/page={page}/id={args.app_id}/sortby=mostrecent/json")
+            if not data: continue
+            path = os.path.join(args.folder, f"rss_{store}_{page}.json")
+            with open(path, "w") as file:
+                json.dump(data, file, ensure_ascii=False)
+            print(f"Saved: {path} ({len(data.get('feed', {}).get('entry', []))} entries)")
+
+if __name__ == '__main__':
+    main()
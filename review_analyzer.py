@@ -1,121 +1,331 @@
-import argparse, os
-from utils.analyzer import gpt_models, GPTWrapper
-from utils.load_app_info import load_ios_app_info
-from utils.load_reviews import load_ios_reviews
-from utils.load_android_app_info import load_android_app_info
-from utils.load_android_reviews import load_android_reviews
-from utils.create_html import create_html
-from utils.sensortower import get_revenue_and_downloads
-
-def parse_arguments():
-    parser = argparse.ArgumentParser(description='Python script localize your application powered with GPT.')
+import argparse, os, random, sys, time
+from utils.gpt_models import gpt_models
+from utils.metrics import metrics
+
+# Modules with heavy dependencies (openai, tiktoken, requests, google_play_scraper, numpy...) are imported
+# inside the commands that need them: `render` and `fetch` start without the GPT stack.
+
+COMMANDS = ("fetch", "analyze", "render")
+
+def parse_arguments(argv=None):
+    # fetch: app info + new reviews into the review cache; analyze: fetch + GPT + HTML (default);
+    # render: HTML again from the last analysis in the run journal
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in COMMANDS + ("-h", "--help"):
+        argv = ["analyze"] + argv # old style call without a command
+
+    common = argparse.ArgumentParser(add_help=False)
     
-    parser.add_argument('--gpt_api_key',
+    common.add_argument('--app_ids',
                         type=str,
                         required=True,
-                        help='Your GPT API key')
+                        help='Array of Apps IDs: "1620725834,1448868559"')
     
-    list_models = ", ".join(list(gpt_models.keys()))
-    parser.add_argument('--gpt_model',
+    save_folder = os.path.join(os.path.dirname(__file__), "temp")
+    common.add_argument('--save_folder',
+                        type=str,
+                        default=save_folder,
+                        help='Where to save final HTML')
+    
+    cache_folder = os.path.join(os.path.dirname(__file__), "temp", "cache")
+    common.add_argument('--cache_folder',
                         type=str,
-                        default="gpt-4.1-mini",
-                        help=f'Choose model from: {list_models}')
+                        default=cache_folder,
+                        help='Where to keep downloaded reviews between runs, only new reviews are fetched')
     
-    parser.add_argument('--app_ids',
+    common.add_argument('--metrics_file',
                         type=str,
-                        required=True,
-                        help='Array of Apps IDs: "1620725834,1448868559"')
+                        default=None,
+                        help='Where to write JSON run metrics; default: <save_folder>/metrics/run_<time>.json (watch.json with --watch)')
     
-    parser.add_argument('--stores',
+    common.add_argument('--prometheus_file',
                         type=str,
-                        default="us,ca,au,ru,it,in,fr,gb,ua,jp,cn,tw,my,de,kr,br,mx,es,sa,ae,vn,tr",
-                        help='Array of Stores: "us,it"; Only for AppStore')
+                        default=None,
+                        help='Also write metrics in Prometheus textfile format (for node_exporter)')
+    
+    fetching = argparse.ArgumentParser(add_help=False)
+    
+    fetching.add_argument('--stores',
+                          type=str,
+                          default="us,ca,au,ru,it,in,fr,gb,ua,jp,cn,tw,my,de,kr,br,mx,es,sa,ae,vn,tr",
+                          help='Array of Stores: "us,it"; Only for AppStore')
+    
+    fetching.add_argument('--android_pages',
+                          type=int,
+                          default=10,
+                          help='Google Play pages (199 reviews) per language per run; with review cache next runs continue deeper into history')
+    
+    fetching.add_argument('--no_dedup',
+                          action='store_true',
+                          help='Keep reviews repeated across stores/languages')
     
-    parser.add_argument('--with_app_description',
+    fetching.add_argument('--near_duplicates',
+                          action='store_true',
+                          help='Also drop near duplicated reviews (slightly edited copies)')
+    
+    fetching.add_argument('--export_folder',
+                          type=str,
+                          default=None,
+                          help='Also export collected reviews there, partitioned by platform/app_id/store/month')
+    
+    fetching.add_argument('--export_format',
+                          type=str,
+                          default="jsonl",
+                          choices=["jsonl", "parquet"],
+                          help='Export format: gzip compressed JSONL or Parquet (needs pyarrow)')
+    
+    fetching.add_argument('--http_timeout',
+                          type=float,
+                          default=30,
+                          help='Read timeout in seconds for every HTTP request (connect timeout is 5s)')
+    
+    fetching.add_argument('--no_review_cache',
+                          action='store_true',
+                          help='Download all reviews from scratch and do not store them')
+    
+    fetching.add_argument('--no_metadata_cache',
+                          action='store_true',
+                          help='Always fetch app info and SensorTower pages fresh')
+    
+    fetching.add_argument('--metadata_ttl_hours',
+                          type=float,
+                          default=24,
+                          help='App info younger than this is used without any request, older is revalidated (ETag / Last-Modified)')
+    
+    fetching.add_argument('--workers',
+                          type=int,
+                          default=4,
+                          help='How many apps are processed at the same time')
+    
+    report = argparse.ArgumentParser(add_help=False)
+    
+    report.add_argument('--no_browser',
                         action='store_true',
-                        help='By default do not use app description for analyzing only user reviews')
+                        help='Do not open created HTML reports in the browser')
     
-    save_folder = os.path.join(os.path.dirname(__file__), "temp")
-    parser.add_argument('--save_folder',
-                        type=str,
-                        default=save_folder,
-                        help='Where to save final HTML')
+    analysis = argparse.ArgumentParser(add_help=False)
+    
+    analysis.add_argument('--gpt_api_key',
+                          type=str,
+                          required=True,
+                          help='Your GPT API key')
+    
+    list_models = ", ".join(list(gpt_models.keys()))
+    analysis.add_argument('--gpt_model',
+                          type=str,
+                          default="gpt-4.1-mini",
+                          help=f'Choose model from: {list_models}')
+    
+    analysis.add_argument('--with_app_description',
+                          action='store_true',
+                          help='By default do not use app description for analyzing only user reviews')
     
-    return parser.parse_args()
+    analysis.add_argument('--resume',
+                          action='store_true',
+                          help='Continue the previous run: stages already finished for an app (info, reviews, analysis, sensortower, HTML) are not repeated')
+    
+    analysis.add_argument('--no_gpt_cache',
+                          action='store_true',
+                          help='Always request GPT, even if the same reviews were analyzed before')
+    
+    analysis.add_argument('--gpt_cache_ttl_days',
+                          type=float,
+                          default=30,
+                          help='How long cached GPT answers are reused')
+    
+    analysis.add_argument('--max_input_tokens',
+                          type=int,
+                          default=None,
+                          help='Token budget for reviews sent to GPT; by default model context minus reserved output')
+    
+    analysis.add_argument('--reserve_output_tokens',
+                          type=int,
+                          default=4096,
+                          help='Tokens of model context kept for the answer')
+    
+    analysis.add_argument('--selection',
+                          type=str,
+                          default="longest",
+                          choices=["longest", "stratified"],
+                          help='Which reviews go to GPT first: the longest ones or a sample stratified by rating/version/store/recency with vote weighted priority')
+    
+    analysis.add_argument('--max_reviews',
+                          type=int,
+                          default=None,
+                          help='Send at most this many reviews even if more fit into the token budget')
+    
+    analysis.add_argument('--cluster',
+                          action='store_true',
+                          help='Group similar reviews (TF-IDF + k-means, needs numpy) and send one representative per group with its size')
+    
+    analysis.add_argument('--max_clusters',
+                          type=int,
+                          default=50,
+                          help='Most clusters per sentiment (negative, neutral, positive) with --cluster')
+    
+    analysis.add_argument('--incremental',
+                          action='store_true',
+                          help='Analyze reviews per app version and keep the results; next runs send only versions with new reviews and merge')
+    
+    analysis.add_argument('--map_reduce',
+                          action='store_true',
+                          help='Analyze all reviews: split them into chunks of --max_input_tokens, analyze chunks in parallel and merge results')
+    
+    analysis.add_argument('--max_gpt_concurrency',
+                          type=int,
+                          default=4,
+                          help='How many GPT requests can run at the same time')
+    
+    analysis.add_argument('--gpt_rpm',
+                          type=float,
+                          default=None,
+                          help='Requests per minute limit of your OpenAI organization')
+    
+    analysis.add_argument('--gpt_tpm',
+                          type=float,
+                          default=None,
+                          help='Tokens per minute limit of your OpenAI organization')
+    
+    analysis.add_argument('--watch',
+                          action='store_true',
+                          help='Keep running and poll the apps every --watch_interval_minutes; reports are rebuilt only for apps with new reviews')
+    
+    analysis.add_argument('--watch_interval_minutes',
+                          type=float,
+                          default=60,
+                          help='Time between --watch cycles')
+    
+    analysis.add_argument('--watch_jitter',
+                          type=float,
+                          default=0.1,
+                          help='Random +- share of the interval added to every --watch pause, so several watchers do not poll at the same moment')
+    
+    parser = argparse.ArgumentParser(description='Python script localize your application powered with GPT.')
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("fetch", parents=[common, fetching], help='Load app info and new reviews into the review cache, no GPT')
+    commands.add_parser("analyze", parents=[common, fetching, analysis, report], help='Fetch, analyze with GPT and create HTML reports (default)')
+    commands.add_parser("render", parents=[common, report], help='Create HTML reports again from the last analysis, no network')
+    args = parser.parse_args(argv)
+    if args.command == "analyze" and args.incremental:
+        # version groups are cut to the selection budget and kept in the review cache
+        unsupported = [f"--{flag}" for flag in ("map_reduce", "cluster", "no_review_cache") if getattr(args, flag)]
+        if unsupported: parser.error(f"--incremental can't be combined with {', '.join(unsupported)}")
+    return args
 
 def main():
     args = parse_arguments()
-    gpt = GPTWrapper(api_key=args.gpt_api_key, model=args.gpt_model)
-    if not gpt: exit
-
     app_ids = args.app_ids.split(",")
     app_ids = [x for x in app_ids if len(x)>0]
     app_ids = [x.strip() for x in app_ids]
+    {"fetch": fetch, "analyze": analyze, "render": render}[args.command](args, app_ids)
+
+def configure_fetching(args):
+    # returns the review store or None
+    from utils import http_client, metadata_cache
+    from utils.review_store import ReviewStore
+    if args.export_folder:
+        from utils.review_export import check_format
+        check_format(args.export_format)
+    http_client.configure(timeout=(5, args.http_timeout))
+    if not args.no_metadata_cache:
+        metadata_cache.configure(os.path.join(args.cache_folder, "metadata"), ttl_seconds=args.metadata_ttl_hours * 3600)
     stores = args.stores.split(",")
-    stores = [x.strip() for x in stores]
-
-    for app_id in app_ids:
-        is_appstore = app_id.isdigit() and len(app_id) > 5
-        print(f"Load app info: {app_id} ({'AppStore' if is_appstore else 'GooglePlay'})")
-
-        if is_appstore:
-            app_info = load_ios_app_info(app_id)
-        else:
-            app_info = load_android_app_info(app_id)
-            
-        if "name" in app_info:
-            print(f"Info loaded for app: {app_info['name']};\nStart load reviews..")
-        else:
-            print(f"Can't load app info: {app_id}; Break")
-            continue
-
-        if is_appstore:
-            app_reviews = load_ios_reviews(app_id, stores=stores)
-            app_info["reviews_count"] = len(app_reviews)
-        else:
-            app_reviews = load_android_reviews(app_id)
-            
-        if len(app_reviews) > 5:
-            print(f"{len(app_reviews)} reviews of the app have been downloaded; Start analyzing..")
-        else:
-            print(f"There are not enough reviews to analyze the app. You can look at them yourself.\n{app_reviews}")
-            print("Break!")
-            continue
-        
-        process_app_info = app_info.copy()
-        process_app_info.pop('icon', None)
-        process_app_info.pop('screenshots', None)
-        process_app_info.pop('description', None) # With description it take Pros from it
-
-        # reviews with more symbols othen cares more info about app
-        app_reviews.sort(key=lambda x: (len(x["content"]) + len(x.get("title", ""))), reverse=True)
-        app_reviews = app_reviews[:500] # seams useless to process more than 500 reviews
-        app_reviews.sort(key=lambda x: (x["date"]), reverse=True)
-        reviews_to_process = [review.copy() for review in app_reviews]
-        for review in reviews_to_process:
-            review.pop('author', None)
-            review.pop('date', None)
-        analysis = gpt.process_reviews(app_info=process_app_info, reviews=reviews_to_process)
-        sensor_info = get_revenue_and_downloads(app_id=app_id)
-        # analysis = gpt.get_debug_analysis()
-
-        print(f"Analyze is done:\n{analysis}")
-        print(f"Prepare HTML..")
-
-        dir_path = os.path.abspath(args.save_folder)
-        os.makedirs(dir_path, exist_ok=True)
-        platform_prefix = "ios" if is_appstore else "android"
-        name = f"{platform_prefix}_{app_id}_{app_info['name']}.html"
-        name = name.replace(" ", "_")
-        file_name = os.path.join(dir_path, name)
-        create_html(app_analysis=analysis["app_analysis"], 
-                    app_info=app_info, 
-                    app_reviews=app_reviews, 
-                    sensortower_info=sensor_info, 
-                    save_to_path=file_name,
-                    app_id=app_id,
-                    is_appstore=is_appstore)
-        print(f"Done: {app_info['name']};\nResult saved to: {file_name}")
+    args.stores = [x.strip() for x in stores]
+    return None if args.no_review_cache else ReviewStore(os.path.join(args.cache_folder, "reviews.sqlite"))
+
+def fetch(args, app_ids):
+    from utils.pipeline import fetch_apps
+    review_store = configure_fetching(args)
+    with metrics.stage("run"):
+        fetch_apps(app_ids, args, review_store)
+    print_fetch_stats()
+    finish_run(args)
+
+def render(args, app_ids):
+    from utils.pipeline import render_apps
+    from utils.run_journal import RunJournal
+    with metrics.stage("run"):
+        render_apps(app_ids, args, RunJournal(os.path.join(args.cache_folder, "journal")))
+    finish_run(args)
+
+def analyze(args, app_ids):
+    from utils.analyzer import GPTWrapper
+    from utils.gpt_cache import GPTCache
+    from utils.rate_limit import RateLimiter
+    from utils.run_journal import RunJournal
+    gpt_cache = None
+    if not args.no_gpt_cache:
+        gpt_cache = GPTCache(os.path.join(args.cache_folder, "gpt"), ttl_seconds=args.gpt_cache_ttl_days * 24 * 3600)
+    rate_limiter = RateLimiter(args.gpt_rpm, args.gpt_tpm) if args.gpt_rpm or args.gpt_tpm else None
+    gpt = GPTWrapper(api_key=args.gpt_api_key, model=args.gpt_model, cache=gpt_cache,
+                     max_concurrency=args.max_gpt_concurrency, rate_limiter=rate_limiter)
+    if not gpt: exit
+    if args.cluster:
+        from utils.clustering import check_available as check_clustering
+        check_clustering()
+    review_store = configure_fetching(args)
+
+    journal = RunJournal(os.path.join(args.cache_folder, "journal"))
+    if not args.resume:
+        for app_id in app_ids: journal.clear(app_id)
+
+    if not args.watch:
+        run_cycle(app_ids, args, gpt, gpt_cache, review_store, journal)
+        return
+
+    # clients, tokenizer, review store and caches stay warm between cycles;
+    # nothing is restored from the journal here, it only gets the inputs of every rebuilt report for `render`
+    args.no_browser = True # a report tab every cycle would be too much
+    reported = {}
+    while True:
+        run_cycle(app_ids, args, gpt, gpt_cache, review_store, reported=reported, report_journal=journal)
+        pause = args.watch_interval_minutes * 60 * (1 + random.uniform(-args.watch_jitter, args.watch_jitter))
+        print(f"Next check at {time.strftime('%H:%M:%S', time.localtime(time.time() + pause))}")
+        try:
+            time.sleep(max(0, pause))
+        except KeyboardInterrupt:
+            print("Watch stopped")
+            break
+
+def run_cycle(app_ids, args, gpt, gpt_cache, review_store, journal=None, reported=None, report_journal=None):
+    from utils import http_client
+    from utils.pipeline import run_apps
+    metrics.reset()
+    http_client.reset_stats()
+    # gpt and gpt_cache count since start, --watch prints this cycle only like the metrics file
+    cache_before = gpt_cache.get_stats() if gpt_cache else None
+    tokens_before = (gpt.total_in_tokens, gpt.total_out_tokens)
+    with metrics.stage("run"):
+        run_apps(app_ids, args, gpt, review_store, journal, reported, report_journal)
+
+    print_fetch_stats()
+    if gpt_cache:
+        cache_stats = gpt_cache.get_stats()
+        print(f"GPT cache: {cache_stats['hits'] - cache_before['hits']} hits, {cache_stats['misses'] - cache_before['misses']} misses")
+    print(f"GPT tokens: {gpt.total_in_tokens - tokens_before[0]} in, {gpt.total_out_tokens - tokens_before[1]} out")
+    finish_run(args)
+
+def print_fetch_stats():
+    from utils import http_client, metadata_cache
+    http_stats = http_client.get_stats()
+    print(f"HTTP: {http_stats['requests']} requests, {http_stats['connections_opened']} connections opened, {http_stats['connections_reused']} reused")
+    metadata_stats = metadata_cache.get_stats()
+    if metadata_stats:
+        print(f"Metadata cache: {metadata_stats['fresh']} fresh, {metadata_stats['not_modified']} not modified (304), {metadata_stats['modified']} modified, {metadata_stats['misses']} misses, {metadata_stats['stale']} stale")
+
+def finish_run(args):
+    stage_totals = metrics.stage_totals()
+    print("Stage time (sum over apps): " + ", ".join(f"{name} {seconds:.1f}s" for name, seconds in stage_totals.items()))
+
+    metrics_file = args.metrics_file
+    if not metrics_file:
+        # one file per run, but --watch overwrites the same file every cycle instead of piling up thousands
+        name = "watch.json" if getattr(args, "watch", False) else f"run_{time.strftime('%Y%m%d_%H%M%S')}.json"
+        metrics_file = os.path.join(os.path.abspath(args.save_folder), "metrics", name)
+    metrics.write_json(metrics_file)
+    print(f"Metrics saved to: {metrics_file}")
+    if args.prometheus_file:
+        metrics.write_prometheus(args.prometheus_file)
         
 
 if __name__ == '__main__':
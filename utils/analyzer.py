@@ -1,40 +1,180 @@
-import json
-from openai import OpenAI
+import json, threading, time, asyncio, weakref
+from concurrent.futures import ThreadPoolExecutor
+import openai
+from openai import OpenAI, AsyncOpenAI
 import tiktoken
 from tqdm.auto import tqdm
+from utils.rate_limit import backoff_delay, parse_retry_after
+from utils.metrics import metrics
+from utils.gpt_models import gpt_models
 
-# only this models supprot json response
-gpt_models = {
-	"gpt-4-1106-preview": 128000,
-	"gpt-3.5-turbo-1106": 16385,
-    "gpt-4o-2024-05-13": 128000,
-    "gpt-4o-mini-2024-07-18": 128000,
-    "gpt-4o-mini": 128000,
-    "gpt-4.1-mini": 128000,
-    "gpt-4.1-nano": 128000
-}
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+def _retry_delay(error: Exception, attempt: int):
+    # seconds to wait before the next attempt, None if the error is not worth retrying
+    if isinstance(error, openai.APIConnectionError): # timeouts included
+        return backoff_delay(attempt)
+    if isinstance(error, openai.APIStatusError) and error.status_code in RETRYABLE_STATUS_CODES:
+        if getattr(error, "code", None) == "insufficient_quota": return None
+        return backoff_delay(attempt, retry_after=parse_retry_after(error.response.headers))
+    return None
+
+def _item_texts(items) -> list:
+    # compact JSON of every item; ReviewView serializes straight from its columns
+    if hasattr(items, "payload_texts"): return items.payload_texts()
+    return [json.dumps(item, ensure_ascii=False, separators=(',', ':')) for item in items]
+
+def _join_items_message(container: dict, key: str, texts: list) -> str:
+    # same as json.dumps({**container, key: items}) from already serialized items
+    head = json.dumps({**container, key: []}, ensure_ascii=False, separators=(',', ':'))
+    return head[:-3] + "[" + ",".join(texts) + "]}"
 
 class GPTWrapper:
-    def __init__(self, api_key, model, temperature = 0.4, max_input_token_count = None):
+    def __init__(self, api_key, model, temperature = 0.4, max_input_token_count = None, cache = None, max_concurrency = 4,
+                 rate_limiter = None, max_retries = 5, base_url = None):
         if model not in gpt_models:
             print(f"Can't find {model} in list available models")
             return None
         
-        self.client = OpenAI(api_key=api_key)
+        # retries are done here, with the rate limiter and Retry-After in mind
+        self.client = OpenAI(api_key=api_key, base_url=base_url, max_retries=0)
         self.model = model
         self.temperature = temperature
-        self.enc = tiktoken.encoding_for_model("gpt-4")
+        self._enc = None # tokenizer, loaded on first use
         self.max_input_token_count = max_input_token_count if max_input_token_count else gpt_models[model]
         self.total_in_tokens = 0
         self.total_out_tokens = 0
+        self.cache = cache # GPTCache
+        self.tokens_lock = threading.Lock()
+        self.enc_lock = threading.Lock()
+        self.request_semaphore = threading.BoundedSemaphore(max_concurrency) # shared by all apps and chunks
+        self.rate_limiter = rate_limiter # RateLimiter
+        self.max_retries = max_retries
+        self.retries = 0
 
+    @property
+    def enc(self):
+        # the BPE table takes a while to load, so it is loaded on the first token count, not with the client
+        if self._enc is None:
+            with self.enc_lock:
+                if self._enc is None: self._enc = tiktoken.encoding_for_model("gpt-4")
+        return self._enc
     
-    def process_reviews(self, app_info: dict, reviews: list):
-        prompt = self.__generate_promp()
-        data = {"app": app_info, "reviews": reviews}
-        result = self.__process_json_internal(prompt, data)
+    def process_reviews(self, app_info: dict, reviews):
+        # `reviews`: list of dicts or ReviewView
+        return self._process_review_texts(app_info, _item_texts(reviews))
+
+    def _process_review_texts(self, app_info: dict, texts: list):
+        prompt = self._generate_promp()
+        message = _join_items_message({"app": app_info}, "reviews", texts)
+        result = self.__process_message(prompt, message)
         return result
     
+    def _count_tokens(self, prompt: str, container: dict, texts: list):
+        # tokens of prompt + empty container and tokens of every serialized item (one encode_batch call)
+        base = len(self.enc.encode(prompt, disallowed_special=()))
+        base += len(self.enc.encode(json.dumps(container, ensure_ascii=False, separators=(',', ':')), disallowed_special=()))
+        base += 10 # chat format tokens for 2 messages
+        counts = [len(tokens) + 1 for tokens in self.enc.encode_batch(texts, disallowed_special=())] # +1 separator
+        return base, counts
+
+    def _available_tokens(self, reserve_output_tokens, input_budget):
+        available = self.max_input_token_count - reserve_output_tokens
+        return min(available, input_budget) if input_budget else available
+
+    def select_reviews(self, app_info: dict, reviews, reserve_output_tokens = 4096, input_budget = None, max_reviews = None):
+        # `reviews` are in priority order, greedily take the ones that still fit into the input budget
+        available = self._available_tokens(reserve_output_tokens, input_budget)
+        used, token_counts = self._count_tokens(self._generate_promp(), {"app": app_info, "reviews": []}, _item_texts(reviews))
+        selected = []
+        for idx, count in enumerate(token_counts):
+            if max_reviews and len(selected) >= max_reviews: break
+            if used + count > available: continue
+            selected.append(idx)
+            used += count
+
+        stats = {"selected": len(selected), "total": len(reviews), "used_tokens": used, "available_tokens": available}
+        return selected, stats
+
+    @staticmethod
+    def _pack_chunks(base: int, token_counts: list, available: int):
+        # consecutive items into chunks under `available` tokens; items bigger than a whole chunk are not in any (see _chunk_items)
+        chunks, chunk, used = [], [], base
+        for idx, count in enumerate(token_counts):
+            if base + count > available: continue
+            if used + count > available:
+                chunks.append(chunk)
+                chunk, used = [], base
+            chunk.append(idx)
+            used += count
+        if chunk: chunks.append(chunk)
+        return chunks
+
+    def _chunk_items(self, base: int, token_counts: list, available: int, reserve_output_tokens: int, what: str):
+        # chunks under `available`; items bigger than that get chunks of the whole model context,
+        # items too big even for it are left out (printed and counted)
+        chunks = self._pack_chunks(base, token_counts, available)
+        packed = {idx for chunk in chunks for idx in chunk}
+        oversize = [idx for idx in range(len(token_counts)) if idx not in packed]
+        if oversize:
+            full = self._available_tokens(reserve_output_tokens, None)
+            extra = self._pack_chunks(base, [token_counts[idx] for idx in oversize], full) if full > available else []
+            chunks += [[oversize[idx] for idx in chunk] for chunk in extra]
+            dropped = len(oversize) - sum(len(chunk) for chunk in extra)
+            if dropped:
+                print(f"{dropped} of {len(token_counts)} {what} do not fit into the model context and are left out")
+                metrics.incr(f"{what}_dropped", dropped)
+        return chunks
+
+    def _reduce_plan(self, prompt: str, app_info: dict, analyses: list, available: int, reserve_output_tokens: int):
+        # returns (budget, groups): one group is the final request, several are merged level by level.
+        # When merging in `available` would not shrink the input, the whole model context is used;
+        # what still does not fit into one request is left out (printed and counted)
+        base, token_counts = self._count_tokens(prompt, {"app": app_info, "analyses": []}, _item_texts(analyses))
+        for budget in dict.fromkeys((available, self._available_tokens(reserve_output_tokens, None))):
+            groups = self._pack_chunks(base, token_counts, budget)
+            packed = sum(len(group) for group in groups)
+            if packed == len(analyses) and (len(groups) <= 1 or len(groups) < len(analyses)):
+                return budget, groups
+        groups = groups[:1]
+        dropped = len(analyses) - sum(len(group) for group in groups)
+        print(f"{dropped} of {len(analyses)} partial analyses do not fit into the model context and are left out of the merge")
+        metrics.incr("analyses_dropped", dropped)
+        return budget, groups
+
+    def process_reviews_map_reduce(self, app_info: dict, reviews, reserve_output_tokens = 4096, chunk_tokens = None, max_workers = 4):
+        # map: analyze token sized chunks of all reviews in parallel; reduce: merge partial analyses
+        available = self._available_tokens(reserve_output_tokens, chunk_tokens)
+        texts = _item_texts(reviews)
+        base, token_counts = self._count_tokens(self._generate_promp(), {"app": app_info, "reviews": []}, texts)
+        chunks = self._chunk_items(base, token_counts, available, reserve_output_tokens, "reviews")
+        if len(chunks) <= 1:
+            return self._process_review_texts(app_info, [texts[idx] for idx in (chunks[0] if chunks else [])])
+
+        print(f"Analyze {len(texts)} reviews in {len(chunks)} chunks..")
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            partials = list(tqdm(pool.map(lambda chunk: self._process_review_texts(app_info, [texts[idx] for idx in chunk]), chunks),
+                                 total=len(chunks), desc="Analyze chunks", leave=False))
+        analyses = [partial["app_analysis"] for partial in partials]
+        return self._reduce_analyses(app_info, analyses, available, max_workers, reserve_output_tokens)
+
+    def merge_analyses(self, app_info: dict, analyses: list, reserve_output_tokens = 4096, input_budget = None, max_workers = 4):
+        # one overall analysis from partial ones (chunks, app versions)
+        return self._reduce_analyses(app_info, analyses, self._available_tokens(reserve_output_tokens, input_budget), max_workers,
+                                     reserve_output_tokens)
+
+    def _reduce_analyses(self, app_info: dict, analyses: list, available: int, max_workers: int, reserve_output_tokens: int = 4096):
+        prompt = self._generate_promp(summarize=True)
+        available, groups = self._reduce_plan(prompt, app_info, analyses, available, reserve_output_tokens)
+        if len(groups) <= 1:
+            analyses = [analyses[idx] for idx in (groups[0] if groups else [])]
+            return self.__process_json_internal(prompt, {"app": app_info, "analyses": analyses})
+
+        # too many partial results for one request, merge them level by level
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            merged = list(pool.map(lambda group: self.__process_json_internal(prompt, {"app": app_info, "analyses": [analyses[idx] for idx in group]}), groups))
+        return self._reduce_analyses(app_info, [result["app_analysis"] for result in merged], available, max_workers, reserve_output_tokens)
+
     def get_debug_analysis(self):
         return {
             "app_analysis": {
@@ -63,20 +203,24 @@ class GPTWrapper:
             }
             }
 
-    def __generate_promp(self, summarize=False):
+    def _generate_promp(self, summarize=False):
         prompt = ""
         if summarize:
-            prompt = "Summarize pros and cons."
+            prompt = "Input has several partial analyses, each made for a different part of the app reviews. Summarize pros and cons: merge them into one analysis, join duplicates and put the most frequent and important points first."
         else:
-            prompt = "Help find pros and cons with given description, title, update info. During response give more attention to user review. App description for better context. Fields 'usefull' and 'useless' has number of people votes for this review (not exist if value equal 0)."
+            prompt = "Help find pros and cons with given description, title, update info. During response give more attention to user review. App description for better context. Fields 'usefull' and 'useless' has number of people votes for this review (not exist if value equal 0). Field 'cluster_size' (if exists) is how many similar reviews this one represents, weigh points by it."
         out_format = """{"app_analysis": {"name": "app_name","pros": ["pros_1","pros_2", "..."],"cons": ["cons_1", "cons_2", "..."],"suggest_what_improve": "#1 fix, improve option","why_app_popular": "give you thought why this app popular"}}"""
 
         prompt = f"You are assistant for product manager of mobile apps. Please help analyze user reviews of the app. {prompt} Input will be in JSON format from user. Please give output of result in JSON format. Use english language for output. Template output format:\n{out_format}"
         return prompt
 
-    def __process_json_internal(self, prompt, json_input):
-        message = json.dumps(json_input, ensure_ascii=False, separators=(',', ':'))
-        response = self.client.chat.completions.create(
+    def _prepare_request(self, prompt, message):
+        # returns (request kwargs, estimated input tokens, cache key, cached output or None)
+        cache_key, cached_text = None, None
+        if self.cache:
+            cache_key = self.cache.make_key(self.model, self.temperature, prompt, message)
+            cached_text = self.cache.get(cache_key)
+        request = dict(
             model = self.model,
             temperature = self.temperature,
             response_format = { "type": "json_object" },
@@ -85,7 +229,137 @@ class GPTWrapper:
                 {"role": "user", "content": message}
             ]
         )
+        tokens = 0
+        if self.rate_limiter and cached_text is None:
+            tokens = len(self.enc.encode(prompt, disallowed_special=())) + len(self.enc.encode(message, disallowed_special=()))
+        return request, tokens, cache_key, cached_text
+
+    def _finish_request(self, response, cache_key):
         output_text = response.choices[0].message.content
-        # print("Output Tokens:", len(enc.encode(output_text)))
-        self.total_out_tokens += len(self.enc.encode(output_text))
-        return json.loads(output_text)
\ No newline at end of file
+        usage = getattr(response, "usage", None)
+        if usage:
+            in_tokens, out_tokens = usage.prompt_tokens, usage.completion_tokens
+        else:
+            in_tokens, out_tokens = 0, len(self.enc.encode(output_text))
+        with self.tokens_lock:
+            self.total_in_tokens += in_tokens
+            self.total_out_tokens += out_tokens
+        metrics.incr("gpt_input_tokens", in_tokens, model=self.model)
+        metrics.incr("gpt_output_tokens", out_tokens, model=self.model)
+        result = json.loads(output_text)
+        if cache_key:
+            self.cache.set(cache_key, output_text)
+        return result
+
+    def _should_retry(self, error, attempt):
+        delay = _retry_delay(error, attempt) if attempt < self.max_retries else None
+        if delay is not None:
+            with self.tokens_lock:
+                self.retries += 1
+            metrics.incr("gpt_retries", model=self.model)
+            print(f"GPT request failed: {type(error).__name__}; retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+        return delay
+
+    def __process_json_internal(self, prompt, json_input):
+        message = json.dumps(json_input, ensure_ascii=False, separators=(',', ':'))
+        return self.__process_message(prompt, message)
+
+    def __process_message(self, prompt, message):
+        request, tokens, cache_key, cached_text = self._prepare_request(prompt, message)
+        if cached_text is not None:
+            metrics.incr("gpt_cache_hits")
+            return json.loads(cached_text)
+
+        attempt = 0
+        while True:
+            if self.rate_limiter: self.rate_limiter.acquire(tokens)
+            try:
+                with self.request_semaphore, metrics.stage("gpt_request", model=self.model):
+                    metrics.incr("gpt_requests", model=self.model)
+                    response = self.client.chat.completions.create(**request)
+                break
+            except openai.OpenAIError as e:
+                delay = self._should_retry(e, attempt)
+                if delay is None: raise
+                time.sleep(delay)
+                attempt += 1
+        return self._finish_request(response, cache_key)
+
+
+class AsyncGPTWrapper(GPTWrapper):
+    # asyncio version: many analyses in one event loop, same cache, limits and retries as GPTWrapper
+    def __init__(self, api_key, model, temperature = 0.4, max_input_token_count = None, cache = None, max_concurrency = 4,
+                 rate_limiter = None, max_retries = 5, base_url = None):
+        super().__init__(api_key, model, temperature, max_input_token_count, cache, max_concurrency,
+                         rate_limiter, max_retries, base_url)
+        self.async_client = AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+        self.max_concurrency = max_concurrency
+        self.async_semaphores = weakref.WeakKeyDictionary() # event loop -> semaphore, an asyncio.Semaphore works in one loop only
+        self.semaphores_lock = threading.Lock()
+
+    @property
+    def async_semaphore(self):
+        # created in the running loop, so the same wrapper can be used by one asyncio.run() after another
+        loop = asyncio.get_running_loop()
+        with self.semaphores_lock:
+            semaphore = self.async_semaphores.get(loop)
+            if semaphore is None:
+                semaphore = self.async_semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    async def process_reviews(self, app_info: dict, reviews):
+        return await self._process_review_texts(app_info, _item_texts(reviews))
+
+    async def _process_review_texts(self, app_info: dict, texts: list):
+        prompt = self._generate_promp()
+        return await self.process_message(prompt, _join_items_message({"app": app_info}, "reviews", texts))
+
+    async def process_reviews_map_reduce(self, app_info: dict, reviews, reserve_output_tokens = 4096, chunk_tokens = None):
+        available = self._available_tokens(reserve_output_tokens, chunk_tokens)
+        texts = _item_texts(reviews)
+        base, token_counts = self._count_tokens(self._generate_promp(), {"app": app_info, "reviews": []}, texts)
+        chunks = self._chunk_items(base, token_counts, available, reserve_output_tokens, "reviews")
+        if len(chunks) <= 1:
+            return await self._process_review_texts(app_info, [texts[idx] for idx in (chunks[0] if chunks else [])])
+
+        partials = await asyncio.gather(*(self._process_review_texts(app_info, [texts[idx] for idx in chunk]) for chunk in chunks))
+        return await self._reduce_analyses(app_info, [partial["app_analysis"] for partial in partials], available, reserve_output_tokens)
+
+    async def merge_analyses(self, app_info: dict, analyses: list, reserve_output_tokens = 4096, input_budget = None):
+        return await self._reduce_analyses(app_info, analyses, self._available_tokens(reserve_output_tokens, input_budget),
+                                           reserve_output_tokens)
+
+    async def _reduce_analyses(self, app_info: dict, analyses: list, available: int, reserve_output_tokens: int = 4096):
+        prompt = self._generate_promp(summarize=True)
+        available, groups = self._reduce_plan(prompt, app_info, analyses, available, reserve_output_tokens)
+        if len(groups) <= 1:
+            analyses = [analyses[idx] for idx in (groups[0] if groups else [])]
+            return await self.process_json(prompt, {"app": app_info, "analyses": analyses})
+
+        merged = await asyncio.gather(*(self.process_json(prompt, {"app": app_info, "analyses": [analyses[idx] for idx in group]}) for group in groups))
+        return await self._reduce_analyses(app_info, [result["app_analysis"] for result in merged], available, reserve_output_tokens)
+
+    async def process_json(self, prompt, json_input):
+        return await self.process_message(prompt, json.dumps(json_input, ensure_ascii=False, separators=(',', ':')))
+
+    async def process_message(self, prompt, message):
+        request, tokens, cache_key, cached_text = self._prepare_request(prompt, message)
+        if cached_text is not None:
+            metrics.incr("gpt_cache_hits")
+            return json.loads(cached_text)
+
+        attempt = 0
+        while True:
+            if self.rate_limiter: await self.rate_limiter.acquire_async(tokens)
+            try:
+                async with self.async_semaphore:
+                    with metrics.stage("gpt_request", model=self.model):
+                        metrics.incr("gpt_requests", model=self.model)
+                        response = await self.async_client.chat.completions.create(**request)
+                break
+            except openai.OpenAIError as e:
+                delay = self._should_retry(e, attempt)
+                if delay is None: raise
+                await asyncio.sleep(delay)
+                attempt += 1
+        return self._finish_request(response, cache_key)
@@ -0,0 +1,109 @@
+import math, re, zlib
+from array import array
+from collections import Counter
+from utils.dedup import normalize_text
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Groups similar reviews before GPT: hashed TF-IDF vectors + spherical k-means (numpy), per sentiment.
+# Only the review closest to each cluster center goes to GPT, with `cluster_size` = how many reviews it stands for.
+# Thousands of "great app" / "crashes after update" reviews become a few dozen representatives.
+
+VECTOR_SIZE = 256 # hashed feature space, keeps memory at N x 256 floats
+SENTIMENTS = (("negative", (1, 2)), ("neutral", (3,)), ("positive", (4, 5)))
+KMEANS_ITERATIONS = 15
+TOP_TERMS = 3
+
+_words = re.compile(r"\w+")
+
+def check_available():
+    if np is None:
+        raise ImportError("Review clustering needs numpy: pip install numpy")
+
+def _terms(text: str) -> list:
+    words = _words.findall(normalize_text(text))
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+def _hash(term: str) -> int:
+    return zlib.crc32(term.encode("utf-8"))
+
+def vectorize(texts: list):
+    # returns (L2 normalized N x VECTOR_SIZE matrix, terms of every text, idf of every term)
+    documents = [_terms(text) for text in texts]
+    document_frequency = Counter(term for terms in documents for term in set(terms))
+    idf = {term: math.log((1 + len(texts)) / (1 + count)) + 1 for term, count in document_frequency.items()}
+
+    rows, columns, values = [], [], []
+    for row, terms in enumerate(documents):
+        for term, count in Counter(terms).items():
+            h = _hash(term)
+            rows.append(row)
+            columns.append(h % VECTOR_SIZE)
+            values.append((1 + math.log(count)) * idf[term] * (1 if h & 0x80000000 else -1)) # sign bit spreads collisions
+    matrix = np.zeros((len(texts), VECTOR_SIZE), dtype=np.float32)
+    np.add.at(matrix, (np.array(rows, dtype=np.int64), np.array(columns, dtype=np.int64)), np.array(values, dtype=np.float32))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix /= np.where(norms > 0, norms, 1)
+    return matrix, documents, idf
+
+def kmeans(matrix, k: int, seed: int = 0):
+    # spherical k-means with k-means++ start; returns (labels, unit centers)
+    rng = np.random.default_rng(seed)
+    n = matrix.shape[0]
+    centers = [matrix[rng.integers(n)]]
+    distances = 1 - matrix @ centers[0]
+    for _ in range(1, k):
+        weights = np.clip(distances, 0, None).astype(np.float64) ** 2
+        total = weights.sum()
+        index = rng.choice(n, p=weights / total) if total > 0 else rng.integers(n)
+        centers.append(matrix[index])
+        distances = np.minimum(distances, 1 - matrix @ matrix[index])
+    centers = np.array(centers)
+
+    labels = None
+    for _ in range(KMEANS_ITERATIONS):
+        new_labels = np.argmax(matrix @ centers.T, axis=1)
+        if labels is not None and np.array_equal(labels, new_labels): break
+        labels = new_labels
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, matrix)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centers = np.where(norms > 0, sums / np.where(norms > 0, norms, 1), centers) # empty cluster keeps its center
+    return labels, centers
+
+def cluster_count(size: int, max_clusters: int) -> int:
+    return max(1, min(max_clusters, size, int(math.ceil(math.sqrt(size)))))
+
+def cluster_reviews(view, max_clusters: int = 50):
+    # returns (ReviewView of representatives, biggest cluster first, with `cluster_size` set;
+    #          cluster summaries for the report)
+    check_available()
+    table = view.table
+    ratings, titles, contents = table.rating, table.title, table.content
+    representatives, summaries = [], []
+    for sentiment, sentiment_ratings in SENTIMENTS:
+        indices = [idx for idx in view.indices if ratings[idx] in sentiment_ratings]
+        if not indices: continue
+        texts = [f"{titles[idx] or ''} {contents[idx] or ''}" for idx in indices]
+        matrix, documents, idf = vectorize(texts)
+        labels, centers = kmeans(matrix, cluster_count(len(indices), max_clusters))
+        similarity = np.einsum("ij,ij->i", matrix, centers[labels]) # cosine to own center
+        for label in np.unique(labels):
+            members = np.flatnonzero(labels == label)
+            best = members[np.argmax(similarity[members])]
+            terms = Counter()
+            for member in members:
+                for term in set(documents[member]): terms[term] += idf[term]
+            representatives.append((len(members), indices[best]))
+            summaries.append({"sentiment": sentiment, "size": int(len(members)),
+                              "terms": [term for term, _ in terms.most_common(TOP_TERMS)],
+                              "example": texts[best].strip()[:160]})
+
+    for size, idx in representatives:
+        table.cluster_size[idx] = size
+    representatives.sort(key=lambda item: item[0], reverse=True)
+    summaries.sort(key=lambda item: item["size"], reverse=True)
+    return type(view)(table, array("I", (idx for _, idx in representatives))), summaries
@@ -1,159 +1,248 @@
-import json
+import json, html
 import webbrowser, os, re
-import html
 
-def _create_reviews_html_part(reviews):
-    review_items = []
+# Reviews are not rendered on the python side: they go to the page as one compact JSON blob
+# (rows of [rating, version, author, date, title, content]) and the page renders only the visible ones.
+_REVIEW_FIELDS = ("rating", "app_version", "author", "date", "title", "content")
+
+def _write_reviews_data(file, reviews, chunk_size=1000):
+    file.write('<script type="application/json" id="reviews-data">[')
+    chunk = []
+    separator = ""
     for review in reviews:
-        review_content_escaped = html.escape(review['content'])
-        review_title_escaped = html.escape(review.get('title', ''))
-        review_title = review.get("title", "")
-        title_html = f'<h3 class="review-title">{review_title}</h3>' if len(review_title) > 0 else ""
-        text = f'''
-            <div class="review-item">
-                <div class="review-header">
-                    <span class="review-rating">{"⭐" * review["rating"]}</span>
-                    <span class="review-version">v{review["app_version"]}</span>
-                </div>
-                <div class="review-meta">
-                    <span class="review-author">By {review["author"]}</span>
-                    <span class="review-date">{review["date"]}</span>
-                </div>
-                <div class="review-name">
-                    {title_html}
-                    <div class="translation-buttons" data-title="{review_title_escaped}" data-content="{review_content_escaped}">
-                        <button onclick="translateWithGoogle()" title="Translate with Google">🌐</button>
-                        <button onclick="translateWithYandex()" title="Translate with Yandex">🅨</button>
-                        <button onclick="translateWithDeepL()" title="Translate with DeepL">🔤</button>
-                    </div>
-                </div>
-                <p class="review-content">{review["content"]}</p>
-            </div>
-        '''
-        review_items.append(text)
+        row = [review.get(field, "") for field in _REVIEW_FIELDS]
+        # no "<" at all inside the script: "</" would close it, "<!--" would keep the real "</script>" from closing it
+        chunk.append(json.dumps(row, ensure_ascii=False, separators=(',', ':')).replace("<", "\\u003c"))
+        if len(chunk) >= chunk_size:
+            file.write(separator + ",".join(chunk))
+            chunk, separator = [], ","
+    if chunk:
+        file.write(separator + ",".join(chunk))
+    file.write(']</script>')
 
-    review_items = ''.join(review_items)
-    newline = '\\n'
-    return f'''
+def _create_reviews_html_part(reviews_count):
+    return f"""
     <div class="reviews-section">
-        <h2>User Reviews</h2>
-        <div class="reviews-list">
-            {review_items}
+        <h2>User Reviews ({reviews_count})</h2>
+        <div class="reviews-list" id="reviews-viewport">
+            <div id="reviews-window"></div>
         </div>
-        <style>
-            .reviews-section {{
-                margin: 10px;
-                padding: 20px;
-                background: #fbfbfb;
-                border-radius: 10px;
-                box-shadow: 0 2px 10px rgba(0, 0, 0, 0.2);
-            }}
-            .reviews-section h2 {{
-                font-size: 1.5em;
-                margin-bottom: 15px;
-                color: #333;
-                font-weight: 600;
-            }}
-            .review-item {{
-                margin-bottom: 20px;
-                padding: 15px;
-                border-bottom: 1px solid #e0e0e0;
-            }}
-            .review-item:last-child {{
-                border-bottom: none;
-            }}
-            .review-header {{
-                display: flex;
-                justify-content: space-between;
-                margin-bottom: 5px;
-                font-size: 0.9em;
-                color: #666;
-            }}
-            .review-meta {{
-                display: flex;
-                justify-content: space-between;
-                margin-bottom: 10px;
-                font-size: 0.85em;
-                color: #888;
-            }}
-            .review-name {{
-                display: flex;
-                justify-content: space-between;
-            }}
-            .review-author {{
-                font-weight: 600;
-            }}
-            .review-date {{
-                font-style: italic;
-            }}
-            .review-rating {{
-                color: #ffcc00;
-            }}
-            .review-version {{
-                font-style: italic;
-            }}
-            .review-title {{
-                font-size: 1.1em;
-                margin: 5px 0 5px;
-                color: #222;
-                font-weight: 500;
-            }}
-            .review-content {{
-                font-size: 0.95em;
-                line-height: 1.5;
-                color: #444;
-            }}
-            .translation-buttons {{
-                margin-top: 5px;
-                display: flex;
-            }}
-            .translation-buttons button {{
-                margin-right: 5px;
-                padding: 5px;
-                font-size: 1.2em;
-                border: none;
-                border-radius: 50%;
-                cursor: pointer;
-                width: 25px;
-                height: 25px;
-                display: flex;
-                justify-content: center;
-                align-items: center;
-            }}
-            .translation-buttons button:hover {{
-                background-color: #0056b3;
-            }}
-            .translation-buttons button:focus {{
-                outline: none;
-            }}
-        </style>
-        <script>
-            function translateWithGoogle() {{
-                const container = event.currentTarget.closest('.translation-buttons');
-                const title = container.dataset.title;
-                const content = container.dataset.content;
-                const url = `https://translate.google.com/?sl=auto&text=${{encodeURIComponent(title + '\\n' + content)}}`;
-                window.open(url, '_blank');
-            }}
+    </div>
+    """ + _REVIEWS_STYLE + _REVIEWS_SCRIPT
 
-            function translateWithYandex() {{
-                const container = event.currentTarget.closest('.translation-buttons');
-                const title = container.dataset.title;
-                const content = container.dataset.content;
-                const url = `https://translate.yandex.com/?lang=auto-en&text=${{title + encodeURIComponent('\\n') + content}}`;
-                window.open(url, '_blank');
-            }}
+_REVIEWS_STYLE = """
+    <style>
+        .reviews-section {
+            margin: 10px;
+            padding: 20px;
+            background: #fbfbfb;
+            border-radius: 10px;
+            box-shadow: 0 2px 10px rgba(0, 0, 0, 0.2);
+        }
+        .reviews-section h2 {
+            font-size: 1.5em;
+            margin-bottom: 15px;
+            color: #333;
+            font-weight: 600;
+        }
+        .reviews-list {
+            height: 80vh;
+            overflow-y: auto;
+            position: relative;
+        }
+        .review-item {
+            padding: 15px;
+            border-bottom: 1px solid #e0e0e0;
+        }
+        .review-header {
+            display: flex;
+            justify-content: space-between;
+            margin-bottom: 5px;
+            font-size: 0.9em;
+            color: #666;
+        }
+        .review-meta {
+            display: flex;
+            justify-content: space-between;
+            margin-bottom: 10px;
+            font-size: 0.85em;
+            color: #888;
+        }
+        .review-name {
+            display: flex;
+            justify-content: space-between;
+        }
+        .review-author {
+            font-weight: 600;
+        }
+        .review-date {
+            font-style: italic;
+        }
+        .review-rating {
+            color: #ffcc00;
+        }
+        .review-version {
+            font-style: italic;
+        }
+        .review-title {
+            font-size: 1.1em;
+            margin: 5px 0 5px;
+            color: #222;
+            font-weight: 500;
+        }
+        .review-content {
+            font-size: 0.95em;
+            line-height: 1.5;
+            color: #444;
+            white-space: pre-wrap;
+        }
+        .translation-buttons {
+            margin-top: 5px;
+            display: flex;
+        }
+        .translation-buttons button {
+            margin-right: 5px;
+            padding: 5px;
+            font-size: 1.2em;
+            border: none;
+            border-radius: 50%;
+            cursor: pointer;
+            width: 25px;
+            height: 25px;
+            display: flex;
+            justify-content: center;
+            align-items: center;
+        }
+        .translation-buttons button:hover {
+            background-color: #0056b3;
+        }
+        .translation-buttons button:focus {
+            outline: none;
+        }
+    </style>
+"""
 
-            function translateWithDeepL() {{
-                const container = event.currentTarget.closest('.translation-buttons');
-                const title = container.dataset.title;
-                const content = container.dataset.content;
-                const url = `https://www.deepl.com/en/translator#en/${{title + encodeURIComponent('\\n') + content}}`;
-                window.open(url, '_blank');
-            }}
-        </script>
-    </div>
-    '''
+_REVIEWS_SCRIPT = r"""
+    <script>
+        // Virtual list: only reviews around the visible area are in the DOM.
+        // Heights are estimated first and corrected after rendering.
+        const reviewsState = { data: null, heights: null, offsets: null, estimated: 140, overscan: 800 };
+
+        function reviewsData() {
+            if (!reviewsState.data) {
+                reviewsState.data = JSON.parse(document.getElementById('reviews-data').textContent);
+                reviewsState.heights = new Float64Array(reviewsState.data.length).fill(reviewsState.estimated);
+                reviewsState.offsets = new Float64Array(reviewsState.data.length + 1);
+                updateReviewOffsets();
+            }
+            return reviewsState.data;
+        }
+
+        function updateReviewOffsets() {
+            const { heights, offsets } = reviewsState;
+            for (let i = 0; i < heights.length; i++) offsets[i + 1] = offsets[i] + heights[i];
+        }
+
+        function findReviewIndex(offset) {
+            const offsets = reviewsState.offsets;
+            let low = 0, high = offsets.length - 2;
+            while (low < high) {
+                const mid = (low + high + 1) >> 1;
+                if (offsets[mid] <= offset) low = mid; else high = mid - 1;
+            }
+            return Math.max(low, 0);
+        }
+
+        function createReviewElement(review, index) {
+            const [rating, version, author, date, title, content] = review;
+            const item = document.createElement('div');
+            item.className = 'review-item';
+            item.dataset.index = index;
+            const add = (parent, tag, className, text) => {
+                const element = document.createElement(tag);
+                element.className = className;
+                if (text !== undefined) element.textContent = text;
+                parent.appendChild(element);
+                return element;
+            };
+            const header = add(item, 'div', 'review-header');
+            add(header, 'span', 'review-rating', '⭐'.repeat(rating));
+            add(header, 'span', 'review-version', 'v' + version);
+            const meta = add(item, 'div', 'review-meta');
+            add(meta, 'span', 'review-author', 'By ' + author);
+            add(meta, 'span', 'review-date', date);
+            const name = add(item, 'div', 'review-name');
+            if (title) add(name, 'h3', 'review-title', title);
+            const buttons = add(name, 'div', 'translation-buttons');
+            buttons.innerHTML = '<button data-translate="google" title="Translate with Google">🌐</button>' +
+                                '<button data-translate="yandex" title="Translate with Yandex">🅨</button>' +
+                                '<button data-translate="deepl" title="Translate with DeepL">🔤</button>';
+            add(item, 'p', 'review-content', content);
+            return item;
+        }
+
+        function renderReviews() {
+            const viewport = document.getElementById('reviews-viewport');
+            const container = document.getElementById('reviews-window');
+            const data = reviewsData();
+            if (!viewport.clientHeight) return; // hidden
+
+            const top = Math.max(0, viewport.scrollTop - reviewsState.overscan);
+            const bottom = viewport.scrollTop + viewport.clientHeight + reviewsState.overscan;
+            const start = findReviewIndex(top);
+            let end = start;
+            while (end < data.length && reviewsState.offsets[end] < bottom) end++;
+
+            const fragment = document.createDocumentFragment();
+            for (let i = start; i < end; i++) fragment.appendChild(createReviewElement(data[i], i));
+            container.replaceChildren(fragment);
+
+            let changed = false;
+            for (const element of container.children) {
+                const index = Number(element.dataset.index);
+                const height = element.offsetHeight;
+                if (height && height !== reviewsState.heights[index]) {
+                    reviewsState.heights[index] = height;
+                    changed = true;
+                }
+            }
+            if (changed) updateReviewOffsets();
+            const total = reviewsState.offsets[data.length];
+            container.style.paddingTop = reviewsState.offsets[start] + 'px';
+            container.style.paddingBottom = (total - reviewsState.offsets[end]) + 'px';
+        }
+
+        function translateReview(service, index) {
+            const [, , , , title, content] = reviewsData()[index];
+            let url;
+            if (service === 'google') {
+                url = `https://translate.google.com/?sl=auto&text=${encodeURIComponent(title + '\n' + content)}`;
+            } else if (service === 'yandex') {
+                url = `https://translate.yandex.com/?lang=auto-en&text=${encodeURIComponent(title + '\n' + content)}`;
+            } else {
+                url = `https://www.deepl.com/en/translator#en/${encodeURIComponent(title + '\n' + content)}`;
+            }
+            window.open(url, '_blank');
+        }
+
+        document.addEventListener('DOMContentLoaded', () => {
+            const viewport = document.getElementById('reviews-viewport');
+            let scheduled = false;
+            viewport.addEventListener('scroll', () => {
+                if (scheduled) return;
+                scheduled = true;
+                requestAnimationFrame(() => { scheduled = false; renderReviews(); });
+            });
+            viewport.addEventListener('click', (event) => {
+                const button = event.target.closest('button[data-translate]');
+                if (!button) return;
+                const item = button.closest('.review-item');
+                translateReview(button.dataset.translate, Number(item.dataset.index));
+            });
+            window.addEventListener('resize', renderReviews);
+        });
+    </script>
+"""
 
 def _generate_app_store_link(app_id, is_appstore):
     """Generate app store link based on platform and app ID"""
@@ -168,9 +257,29 @@ def _get_platform_name(is_appstore):
     play_store_icon = '<svg xmlns="http://www.w3.org/2000/svg" width="24" height="24" fill="none"><g clip-path="url(#playStore_svg__a)"><path fill="#ea4335" d="M11.684 11.495 1.586 22.053a2.75 2.75 0 0 0 2.623 1.967q.788 0 1.377-.393l11.41-6.492-5.311-5.639z"></path><path fill="#fbbc04" d="m21.913 9.659-4.918-2.82-5.508 4.853 5.574 5.443 4.918-2.754c.852-.459 1.443-1.377 1.443-2.361a2.95 2.95 0 0 0-1.508-2.361z"></path><path fill="#4285f4" d="M1.586 1.987c-.066.197-.066.459-.066.721v18.688c0 .262 0 .459.066.721l10.492-10.295z"></path><path fill="#34a853" d="m11.75 12.02 5.246-5.18L5.651.413C5.258.151 4.733.02 4.209.02c-1.246 0-2.361.852-2.623 1.967z"></path></g><defs><clipPath id="playStore_svg__a"><path fill="#fff" d="M0 0h24v24H0z"></path></clipPath></defs></svg>'
     return f'{appstore_icon} App Store' if is_appstore else f'{play_store_icon} Google Play'
 
+_REVIEWS_PLACEHOLDER = "<!--reviews-->"
+
+def _create_clusters_html_part(clusters):
+    # groups of similar reviews found before analysis (--cluster), biggest first
+    if not clusters: return ""
+    rows = "".join(f"""
+                    <tr class="cluster-{cluster['sentiment']}">
+                        <td>{cluster['size']}</td>
+                        <td>{cluster['sentiment']}</td>
+                        <td>{html.escape(', '.join(cluster['terms']))}</td>
+                        <td>{html.escape(cluster['example'])}</td>
+                    </tr>""" for cluster in clusters)
+    return f"""
+            <div class="clusters">
+                <h2>Review Clusters ({len(clusters)})</h2>
+                <table>
+                    <tr><th>Reviews</th><th>Sentiment</th><th>Key terms</th><th>Typical review</th></tr>{rows}
+                </table>
+            </div>"""
+
 # HTML content
 def _create_html(app_data):
-    reviews_html = _create_reviews_html_part(app_data["reviews"])
+    # returns (page before reviews, page after reviews); reviews are written between them by `create_html`
     app_store_link = _generate_app_store_link(app_data["app_id"], app_data["is_appstore"])
     platform_name = _get_platform_name(app_data["is_appstore"])
 
@@ -236,6 +345,23 @@ def _create_html(app_data):
                 border-radius: 10px;
                 box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
             }}
+            .clusters {{
+                background: #ffffff;
+                padding: 20px;
+                margin-top: 20px;
+                box-shadow: 0 0 10px rgba(0, 0, 0, 0.1);
+            }}
+            .clusters table {{
+                width: 100%;
+                border-collapse: collapse;
+            }}
+            .clusters th, .clusters td {{
+                text-align: left;
+                padding: 6px;
+                border-bottom: 1px solid #e0e0e0;
+            }}
+            .cluster-negative td:nth-child(2) {{ color: #c0392b; }}
+            .cluster-positive td:nth-child(2) {{ color: #27ae60; }}
             .pros-cons {{
                 display: flex;
                 justify-content: space-between;
@@ -299,6 +425,7 @@ def _create_html(app_data):
                 if (reviewList.style.display !== 'block') {{
                     reviewList.style.display = 'block';
                     btn.textContent = 'Hide Reviews';
+                    renderReviews();
                 }} else {{
                     reviewList.style.display = 'none';
                     btn.textContent = 'Show Reviews';
@@ -344,15 +471,16 @@ def _create_html(app_data):
                 </div>
             </div>
             <p><strong>Suggestions for Improvement:</strong> {app_data["app_analysis"]["suggest_what_improve"]}</p>
+            {_create_clusters_html_part(app_data.get("clusters"))}
             <div class="screenshots">
                 <h2>Screenshots</h2>
                 {''.join(f'<img src="{screenshot}" alt="Screenshot">' for screenshot in app_data["screenshots"])}
             </div>
             <div class="reviews">
                 <button id="show-reviews-btn" onclick="toggleReviews()">Show Reviews</button>
-                <ul id="review-list">
-                    {reviews_html}
-                </ul>
+                <div id="review-list">
+                    {_REVIEWS_PLACEHOLDER}
+                </div>
             </div>
         </div>
         <footer>
@@ -361,9 +489,10 @@ def _create_html(app_data):
     </body>
     </html>
     '''
-    return html_content
+    head, tail = html_content.rsplit(_REVIEWS_PLACEHOLDER, 1)
+    return head, tail
 
-def create_html(app_analysis, app_info, app_reviews, sensortower_info, save_to_path, open_html_page=True, app_id=None, is_appstore=None):
+def create_html(app_analysis, app_info, app_reviews, sensortower_info, save_to_path, open_html_page=True, app_id=None, is_appstore=None, clusters=None):
     # Write the HTML content to a file
     app_data = {
         "app_analysis": app_analysis,
@@ -374,16 +503,22 @@ def create_html(app_analysis, app_info, app_reviews, sensortower_info, save_to_p
         "release": app_info["release"],
         "rating": app_info["rating"],
         "rating_count": app_info["rating_count"],
-        "reviews_count": app_info["reviews_count"],
         "downloads": sensortower_info["downloads"],
         "revenue": sensortower_info["revenue"],
         "app_id": app_id,
-        "is_appstore": is_appstore
+        "is_appstore": is_appstore,
+        "clusters": clusters
     }
+    if "reviews_count" in app_info:
+        app_data["reviews_count"] = app_info["reviews_count"]
 
-    html_content = _create_html(app_data)
-    with open(save_to_path, "w") as file:
-        file.write(html_content)
+    # written piece by piece, the whole page is never kept in memory
+    head, tail = _create_html(app_data)
+    with open(save_to_path, "w", encoding="utf-8") as file:
+        file.write(head)
+        file.write(_create_reviews_html_part(len(app_reviews)))
+        _write_reviews_data(file, app_reviews)
+        file.write(tail)
 
     if open_html_page:
         webbrowser.open('file://' + save_to_path)
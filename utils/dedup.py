@@ -0,0 +1,84 @@
+import hashlib, re, unicodedata
+
+# Reviews repeat across App Store storefronts and Google Play languages.
+# Exact duplicates: hash index over normalized (author, content, rating, version).
+# Near duplicates (optional): one-permutation MinHash + LSH buckets over word shingles, then Jaccard check.
+
+_spaces = re.compile(r"\s+")
+_words = re.compile(r"\w+")
+
+MINHASH_BANDS = 4
+MINHASH_ROWS = 3
+_BINS = MINHASH_BANDS * MINHASH_ROWS
+_MASK = (1 << 64) - 1
+
+def normalize_text(text) -> str:
+    text = unicodedata.normalize("NFKC", str(text or "")).casefold()
+    return _spaces.sub(" ", text).strip()
+
+def review_fingerprint(review: dict) -> bytes:
+    raw = "\x1f".join((normalize_text(review.get("author")),
+                       normalize_text(review.get("content")),
+                       str(review.get("rating", "")),
+                       normalize_text(review.get("app_version"))))
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).digest()
+
+def _shingles(text: str, size: int = 3) -> set:
+    words = _words.findall(text)
+    if len(words) <= size: return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def _hash(shingle: str) -> int:
+    # 64 bit and stable across processes (str hash() is randomized per run), so runs drop the same reviews
+    return int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little")
+
+def _lsh_keys(shingles: set) -> list:
+    # one hash per shingle: its remainder picks the bin, the rest competes for the bin minimum
+    signature = [_MASK] * _BINS
+    for shingle in shingles:
+        h = _hash(shingle)
+        idx, value = h % _BINS, h // _BINS
+        if value < signature[idx]: signature[idx] = value
+    return [(band, tuple(signature[band * MINHASH_ROWS:(band + 1) * MINHASH_ROWS])) for band in range(MINHASH_BANDS)]
+
+def dedup_reviews(reviews: list, near_duplicates: bool = False, threshold: float = 0.8, min_words: int = 8):
+    # keeps the first occurrence and the input order; returns (unique reviews, stats)
+    seen = set()
+    unique = []
+    exact = 0
+    for review in reviews:
+        fingerprint = review_fingerprint(review)
+        if fingerprint in seen:
+            exact += 1
+            continue
+        seen.add(fingerprint)
+        unique.append(review)
+
+    near = 0
+    if near_duplicates:
+        buckets = {} # lsh key -> shingles of kept reviews with the same rating
+        kept = []
+        for review in unique:
+            text = normalize_text(f"{review.get('title', '')} {review.get('content', '')}")
+            shingles = _shingles(text)
+            if len(shingles) < min_words: # too short to call it a near copy
+                kept.append(review)
+                continue
+            keys = [(review.get("rating"), key) for key in _lsh_keys(shingles)]
+            is_duplicate = False
+            for key in keys:
+                for other in buckets.get(key, ()):
+                    if len(shingles & other) / len(shingles | other) >= threshold:
+                        is_duplicate = True
+                        break
+                if is_duplicate: break
+            if is_duplicate:
+                near += 1
+                continue
+            for key in keys:
+                bucket = buckets.setdefault(key, [])
+                if len(bucket) < 8: bucket.append(shingles) # bounded work per bucket keeps it linear
+            kept.append(review)
+        unique = kept
+
+    return unique, {"total": len(reviews), "exact_duplicates": exact, "near_duplicates": near, "unique": len(unique)}
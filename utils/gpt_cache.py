@@ -0,0 +1,75 @@
+import hashlib, json, os, threading, time
+
+# On-disk cache of GPT responses, key is hash of everything that affects the answer.
+# Same app info + same reviews -> same request, so report rebuilds cost no tokens.
+# File mtime = when the answer was stored (TTL), atime = last hit (size eviction, least recently used first).
+
+class GPTCache:
+    def __init__(self, folder: str, ttl_seconds: float = 30 * 24 * 3600, max_size_bytes: int = 200 * 1024 * 1024):
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.ttl_seconds = ttl_seconds
+        self.max_size_bytes = max_size_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def make_key(model: str, temperature: float, prompt: str, payload) -> str:
+        canonical = json.dumps([model, temperature, prompt, payload], ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.folder, f"{key}.json")
+
+    def get(self, key: str):
+        path = self._path(key)
+        try:
+            stored = os.path.getmtime(path)
+            if time.time() - stored > self.ttl_seconds:
+                os.remove(path)
+                raise FileNotFoundError(path)
+            with open(path, "r", encoding="utf-8") as file:
+                value = file.read()
+            os.utime(path, (time.time(), stored)) # recently used entries are evicted last, the TTL keeps counting
+        except OSError:
+            with self.lock: self.misses += 1
+            return None
+        with self.lock: self.hits += 1
+        return value
+
+    def set(self, key: str, value: str):
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            file.write(value)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.folder):
+            if not name.endswith(".json"): continue
+            path = os.path.join(self.folder, name)
+            try:
+                stat = os.stat(path)
+                if now - stat.st_mtime > self.ttl_seconds:
+                    os.remove(path)
+                    continue
+            except OSError:
+                continue
+            entries.append((stat.st_atime, stat.st_size, path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size_bytes: break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total_size -= size
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,87 @@
+import threading
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from utils.metrics import metrics
+
+# One pooled keep-alive session for all loaders (itunes, sensortower, ...)
+
+DEFAULT_TIMEOUT = (5, 30) # (connect, read) seconds; without it a stalled socket hangs the run
+DEFAULT_POOL_MAXSIZE = 16 # connections kept alive per host, should be >= parallel requests per host
+DEFAULT_HEADERS = {"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"}
+
+_lock = threading.Lock()
+_session = None
+_config = {"timeout": DEFAULT_TIMEOUT, "pool_maxsize": DEFAULT_POOL_MAXSIZE, "retries": 2}
+_stats = {"requests": 0, "connections_opened": 0}
+
+def _count(name: str, value: int = 1):
+    with _lock:
+        _stats[name] = _stats.get(name, 0) + value
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        _count("connections_opened")
+        return super()._new_conn()
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        _count("connections_opened")
+        return super()._new_conn()
+
+class _CountingAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": _CountingHTTPConnectionPool,
+                                                   "https": _CountingHTTPSConnectionPool}
+
+def _create_session() -> requests.Session:
+    retries = Retry(total=_config["retries"], read=0, backoff_factor=0.5,
+                    status_forcelist=(502, 503, 504), allowed_methods=("GET", "HEAD"),
+                    raise_on_status=False)
+    adapter = _CountingAdapter(pool_connections=10, pool_maxsize=_config["pool_maxsize"], max_retries=retries)
+    session = requests.Session()
+    session.headers.update(DEFAULT_HEADERS)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def configure(timeout=None, pool_maxsize=None, retries=None):
+    global _session
+    with _lock:
+        if timeout is not None: _config["timeout"] = timeout
+        if pool_maxsize is not None: _config["pool_maxsize"] = pool_maxsize
+        if retries is not None: _config["retries"] = retries
+        old_session, _session = _session, None
+    if old_session: old_session.close()
+
+def get_session() -> requests.Session:
+    global _session
+    with _lock:
+        if _session is None:
+            _session = _create_session()
+        return _session
+
+def get(url: str, **kwargs) -> requests.Response:
+    kwargs.setdefault("timeout", _config["timeout"])
+    _count("requests")
+    host = urlparse(url).netloc
+    metrics.incr("http_requests", host=host)
+    with metrics.stage("http", host=host):
+        response = get_session().get(url, **kwargs)
+    if not kwargs.get("stream"):
+        metrics.incr("http_bytes", len(response.content), host=host)
+    return response
+
+def get_stats() -> dict:
+    with _lock:
+        stats = dict(_stats)
+    stats["connections_reused"] = max(stats["requests"] - stats["connections_opened"], 0)
+    return stats
+
+def reset_stats():
+    with _lock:
+        for key in _stats:
+            _stats[key] = 0
@@ -0,0 +1,91 @@
+import hashlib
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from utils.review_store import review_key
+from utils.metrics import metrics
+from utils.review_table import ReviewView
+
+# Incremental analysis: reviews are analyzed per app version group and the results are kept in the review store.
+# A group is sent to GPT again only when its reviews changed (new reviews of the current release),
+# then all group analyses are merged by one cheap call over analyses instead of reviews.
+# Daily runs cost tokens for new reviews only.
+
+MIN_VERSION_REVIEWS = 50 # smaller old versions are analyzed together as "older"
+OLDER_VERSIONS = "older"
+MERGED = "*" # merged analysis row, fingerprint over all group fingerprints
+
+def version_groups(view, analyzed=()) -> dict:
+    # group name -> row positions of `view`; the latest version (newest review) always has its own group,
+    # versions in `analyzed` (own group in an earlier run) keep it, so a new release doesn't move
+    # the previous one into "older" and change that group's fingerprint
+    table = view.table
+    versions, dates = table.app_version, table.date
+    positions = {}
+    newest = {}
+    for position, idx in enumerate(view.indices):
+        version = str(versions[idx] or "")
+        positions.setdefault(version, []).append(position)
+        date = str(dates[idx] or "")
+        if date > newest.get(version, ""): newest[version] = date
+    latest = max(newest, key=newest.get) if newest else None
+
+    groups = {}
+    for version, items in positions.items():
+        own = version == latest or version in analyzed or len(items) >= MIN_VERSION_REVIEWS
+        name = version if own else OLDER_VERSIONS
+        groups.setdefault(name, []).extend(items)
+    for items in groups.values(): items.sort()
+    return groups
+
+def fingerprint(reviews, salt: str = "") -> str:
+    # order independent hash of review identities; `salt` holds the settings that change the answer
+    keys = sorted(review_key(review) for review in reviews)
+    return hashlib.sha1("\n".join([salt] + keys).encode("utf-8")).hexdigest()
+
+def analyze_incremental(app_id: str, platform: str, app_info: dict, reviews_view, gpt, args, review_store, select):
+    # `reviews_view` in priority order, `select(app_info, view)` cuts a view to the token budget;
+    # returns (analysis, ReviewView of reviews shown with it)
+    saved = review_store.get_version_analyses(platform, app_id)
+    groups = version_groups(reviews_view, analyzed=set(saved) - {OLDER_VERSIONS, MERGED})
+    salt = f"{gpt.model}|{args.selection}|{args.max_reviews}|{args.max_input_tokens}|{args.reserve_output_tokens}"
+
+    plans = {} # group -> (fingerprint, selected view, saved analysis or None)
+    for name, positions in groups.items():
+        group_view = reviews_view.take(positions)
+        group_fingerprint = fingerprint(group_view, salt)
+        selected = select({**app_info, "app_version": name}, group_view)
+        saved_fingerprint, saved_analysis = saved.get(name, (None, None))
+        plans[name] = (group_fingerprint, selected, saved_analysis if saved_fingerprint == group_fingerprint else None)
+
+    changed = [name for name, (_, _, analysis) in plans.items() if analysis is None]
+    print(f"{app_info['name']}: {len(plans) - len(changed)} of {len(plans)} version groups unchanged, analyze: {', '.join(changed) or '-'}")
+    metrics.incr("version_groups_reused", len(plans) - len(changed), app_id=app_id)
+    metrics.incr("version_groups_analyzed", len(changed), app_id=app_id)
+
+    def analyze_group(name):
+        group_fingerprint, selected, _ = plans[name]
+        result = gpt.process_reviews(app_info={**app_info, "app_version": name}, reviews=selected)
+        analysis = dict(result["app_analysis"], app_version=name, reviews=len(selected))
+        review_store.set_version_analysis(platform, app_id, name, group_fingerprint, analysis)
+        return name, analysis
+
+    analyses = {name: analysis for name, (_, _, analysis) in plans.items() if analysis is not None}
+    with ThreadPoolExecutor(max_workers=max(1, args.max_gpt_concurrency)) as pool:
+        analyses.update(pool.map(analyze_group, changed))
+
+    # newest versions first, so they survive if the merge input has to be cut
+    order = sorted(plans, key=lambda name: max(plans[name][1].column("date") or [""], key=str), reverse=True)
+    merged_fingerprint = hashlib.sha1("\n".join(f"{name}:{plans[name][0]}" for name in sorted(plans)).encode("utf-8")).hexdigest()
+    saved_fingerprint, merged = saved.get(MERGED, (None, None))
+    if saved_fingerprint != merged_fingerprint:
+        if len(order) == 1:
+            merged = {"app_analysis": {key: value for key, value in analyses[order[0]].items() if key not in ("app_version", "reviews")}}
+        else:
+            merged = gpt.merge_analyses(app_info, [analyses[name] for name in order],
+                                        reserve_output_tokens=args.reserve_output_tokens,
+                                        input_budget=args.max_input_tokens,
+                                        max_workers=args.max_gpt_concurrency)
+        review_store.set_version_analysis(platform, app_id, MERGED, merged_fingerprint, merged)
+
+    shown = array("I", (idx for name in order for idx in plans[name][1].indices))
+    return merged, ReviewView(reviews_view.table, shown)
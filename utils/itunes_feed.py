@@ -0,0 +1,103 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Parser for the App Store customer reviews RSS feed (JSON flavour).
+# Every entry field is {"label": value}:
+#   author.name.label, updated.label, im:rating.label, im:version.label, title.label, content.label,
+#   im:voteCount.label, im:voteSum.label
+# Fields are read with plain lookups (a shared empty dict for missing ones, nothing is allocated),
+# entries without valid rating/votes are counted as malformed.
+
+_EMPTY = {}
+
+def loads(content):
+    # bytes or str of a feed page; orjson when installed
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+def parse_entry(entry):
+    # review dict or None when the entry has no valid rating/votes
+    try:
+        # complete entries: plain subscripts are the fastest way in
+        review = {
+            "author": entry["author"]["name"]["label"],
+            "date": entry["updated"]["label"],
+            "rating": int(entry["im:rating"]["label"]),
+            "app_version": entry["im:version"]["label"],
+            "title": entry["title"]["label"],
+            "content": entry["content"]["label"],
+        }
+        vote_count = int(entry["im:voteCount"]["label"])
+        usefull = int(entry["im:voteSum"]["label"])
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return _parse_partial_entry(entry)
+    return _add_votes(review, vote_count, usefull)
+
+def _add_votes(review, vote_count, usefull):
+    useless = vote_count - usefull
+    if usefull > 0:
+        review["usefull"] = usefull
+    if useless > 0:
+        review["useless"] = useless
+    return review
+
+def _parse_partial_entry(entry):
+    # missing text fields become "", the numbers are required
+    try:
+        get = entry.get
+        rating = int(get("im:rating", _EMPTY).get("label"))
+        vote_count = int(get("im:voteCount", _EMPTY).get("label"))
+        usefull = int(get("im:voteSum", _EMPTY).get("label"))
+        review = {
+            "author": get("author", _EMPTY).get("name", _EMPTY).get("label", ""),
+            "date": get("updated", _EMPTY).get("label", ""),
+            "rating": rating,
+            "app_version": get("im:version", _EMPTY).get("label", ""),
+            "title": get("title", _EMPTY).get("label", ""),
+            "content": get("content", _EMPTY).get("label", ""),
+        }
+    except (AttributeError, TypeError, ValueError):
+        return None
+    return _add_votes(review, vote_count, usefull)
+
+def feed_entries(data) -> list:
+    feed = data.get("feed") if data.__class__ is dict else None
+    if feed.__class__ is not dict: return []
+    entries = feed.get("entry")
+    if entries.__class__ is dict: # a page with one review has it without a list
+        return [entries]
+    return entries if entries.__class__ is list else []
+
+def parse_feed(data):
+    # returns (reviews, malformed entries count)
+    reviews = []
+    malformed = 0
+    for entry in feed_entries(data):
+        review = parse_entry(entry)
+        if review is None:
+            malformed += 1
+        else:
+            reviews.append(review)
+    return reviews, malformed
+
+def page_number(url: str) -> int:
+    start = url.find("/page=")
+    if start == -1: return -1
+    start += 6
+    end = url.find("/", start)
+    number = url[start:end] if end != -1 else url[start:]
+    return int(number) if number.isdigit() else -1
+
+def feed_pages(data) -> dict:
+    # {"first": 1, "last": 10, "previous": 1, "next": 2} from the feed links, one pass
+    try:
+        links = data["feed"]["link"]
+        if links.__class__ is dict: links = [links]
+        return {link["attributes"]["rel"]: page_number(link["attributes"]["href"]) for link in links}
+    except (KeyError, TypeError, AttributeError):
+        return {}
@@ -1,5 +1,6 @@
 from google_play_scraper import app
 import json
+from utils import metadata_cache
 from datetime import datetime
 
 def parse_date(date_input):
@@ -16,6 +17,10 @@ def parse_date(date_input):
         return ""
 
 def __load_android_app_info(country: str, app_id: str) -> dict:
+    # google_play_scraper gives no ETag / Last-Modified, so the info is cached by TTL only
+    cache_key = f"google_play_app:{country}:{app_id}"
+    cached = metadata_cache.get_value(cache_key)
+    if cached: return cached
     try:
         result = app(
             app_id,
@@ -41,6 +46,7 @@ def __load_android_app_info(country: str, app_id: str) -> dict:
                 'rating_count': result.get('ratings', 0),
                 'reviews_count': result.get('reviews', 0)
             }
+            metadata_cache.set_value(cache_key, app_info_dict)
             return app_info_dict
         else:
             print(f'No results found for Android App ID: {app_id}; Country: {country}')
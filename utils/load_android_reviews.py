@@ -1,62 +1,127 @@
 from google_play_scraper import reviews, Sort
+try:
+    # private class, resuming deeper history needs it; tested with google-play-scraper 1.2.7 (requirements.txt)
+    from google_play_scraper.features.reviews import _ContinuationToken
+except ImportError:
+    _ContinuationToken = None
 import json
+from concurrent.futures import ThreadPoolExecutor
 from tqdm.auto import tqdm
 from pathlib import Path
 import os
 from datetime import datetime
+from utils.review_store import take_new_reviews
+from utils.metrics import metrics
+
+PAGE_SIZE = 199 # google_play_scraper requests at most 199 reviews at once
 
 def parse_date(date_input):
     if not date_input:
         return ''
-    
+
     if isinstance(date_input, datetime):
         return date_input.strftime('%Y-%m-%d')
-    
+
     return ""
 
-def get_android_reviews(language, app_id, count=2000):
+def _parse_review(review):
+    parsed_date = parse_date(review.get('at', ''))
+    return {
+        "author": review.get('userName', 'Anonymous'),
+        "date": parsed_date,
+        "rating": review.get('score', 0),
+        "app_version": review.get('reviewCreatedVersion', review.get('appVersion','Unknown')),
+        "content": review.get('content', '')
+    }
+
+def _token_to_state(token):
+    if token is None or token.token is None: return {"token": None}
+    return {"token": token.token, "lang": token.lang, "country": token.country, "sort": token.sort, "count": token.count}
+
+def _state_to_token(state):
+    # None when this google_play_scraper builds its tokens differently; only the resume of old history is lost
     try:
-        result, continuation_token = reviews(
+        return _ContinuationToken(state["token"], state["lang"], state["country"], state["sort"], state["count"], None, None)
+    except TypeError as e:
+        print(f"Can't resume Google Play history, unsupported google-play-scraper version (tested with 1.2.7): {e}")
+        return None
+
+def _fetch_pages(app_id, language, max_pages, known_keys=None, continuation_token=None):
+    # newest first pages until `max_pages`, a known review or the end of the feed;
+    # returns (reviews, pages used, continuation token to go deeper or None when history is over)
+    reviews_list = []
+    token = continuation_token
+    pages = 0
+    while pages < max_pages:
+        result, token = reviews(
             app_id,
             lang=language,
-            count=count,
-            sort=Sort.NEWEST
+            count=PAGE_SIZE,
+            sort=Sort.NEWEST,
+            continuation_token=token
         )
-        
-        reviews_list = []
-        for review in result:
-            parsed_date = parse_date(review.get('at', ''))
-            
-            review_dict = {
-                "author": review.get('userName', 'Anonymous'),
-                "date": parsed_date,
-                "rating": review.get('score', 0),
-                "app_version": review.get('reviewCreatedVersion', review.get('appVersion','Unknown')),
-                "content": review.get('content', '')
-            }
-            reviews_list.append(review_dict)
-        
-        return reviews_list
-        
+        pages += 1
+        metrics.incr("review_pages", store=language)
+        page_reviews, reached_known = take_new_reviews([_parse_review(review) for review in result], known_keys)
+        reviews_list.extend(page_reviews)
+        if reached_known:
+            return reviews_list, pages, token
+        if not result or token.token is None:
+            return reviews_list, pages, None
+    return reviews_list, pages, token
+
+def get_android_reviews(language, app_id, count=2000):
+    try:
+        result, _, _ = _fetch_pages(app_id, language, max_pages=max(1, -(-count // PAGE_SIZE)))
+        return result[:count]
+
     except Exception as e:
-        print(f"Error loading reviews for {app_id} from {country}: {e}")
+        print(f"Error loading reviews for {app_id} from {language}: {e}")
         return []
 
-def load_android_reviews(app_id, save_path=None, languages=["en", "fr", "ru", "it", "hi", "de", "uk", "ja", "zh-CN", "zh-TW", "ms", "es", "pt-BR", "ko", "ar", "tr", "pl", "vi", "id", "th"]):
+def _load_language_reviews(app_id, language, max_pages, review_store):
+    if not review_store:
+        return _tag_store(get_android_reviews(language=language, app_id=app_id, count=max_pages * PAGE_SIZE), language)
+
+    try:
+        # new reviews since the last run
+        known_keys = review_store.known_keys("android", app_id, language)
+        new_reviews, pages, token = _fetch_pages(app_id, language, max_pages, known_keys=known_keys)
+        review_store.add_reviews("android", app_id, language, new_reviews)
+        state = review_store.get_continuation("android", app_id, language)
+        if state is None or not known_keys:
+            # first run: remember where the history stopped
+            review_store.set_continuation("android", app_id, language, _token_to_state(token))
+        elif state["token"] and pages < max_pages and (saved_token := _state_to_token(state)):
+            # rest of the page budget goes deeper into history from the saved token
+            old_reviews, _, token = _fetch_pages(app_id, language, max_pages - pages, continuation_token=saved_token)
+            review_store.add_reviews("android", app_id, language, old_reviews, older=True)
+            review_store.set_continuation("android", app_id, language, _token_to_state(token))
+    except Exception as e:
+        print(f"Error loading reviews for {app_id} from {language}: {e}")
+    return _tag_store(review_store.load_reviews("android", app_id, language), language)
+
+def _tag_store(reviews, language):
+    for review in reviews:
+        review["store"] = language
+    return reviews
+
+def load_android_reviews(app_id, save_path=None, languages=["en", "fr", "ru", "it", "hi", "de", "uk", "ja", "zh-CN", "zh-TW", "ms", "es", "pt-BR", "ko", "ar", "tr", "pl", "vi", "id", "th"], review_store=None, max_pages=10, max_workers=8):
     all_reviews = []
-    pbar = tqdm(languages)
-    
-    for lang in pbar:
-        pbar.set_description_str(f"Load Android reviews from language: {lang}")
-        country_reviews = get_android_reviews(language=lang, app_id=app_id)
-        all_reviews.extend(country_reviews)
-    
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        futures = [pool.submit(_load_language_reviews, app_id, lang, max_pages, review_store) for lang in languages]
+        pbar = tqdm(total=len(languages), desc="Load Android reviews from languages")
+        for future in futures:
+            all_reviews.extend(future.result())
+            pbar.update()
+        pbar.close()
+
     if save_path:
         json.dump(all_reviews, open(save_path, "w"), ensure_ascii=False)
-    
+
     return all_reviews
 
 if __name__ == "__main__":
     app_id = "io.instories"
     downloads_path = str(Path.home() / "Downloads")
-    load_android_reviews(app_id, save_path=os.path.join(downloads_path, f"android_{app_id}_reviews.json"),languages=["en", "ru"])
\ No newline at end of file
+    load_android_reviews(app_id, save_path=os.path.join(downloads_path, f"android_{app_id}_reviews.json"),languages=["en", "ru"])
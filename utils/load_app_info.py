@@ -1,62 +1,77 @@
-import requests
 import json
+import requests
+from utils import metadata_cache
 
-def __load_app_info(store: str, app_id: str) -> dict:
-    # App Store lookup API URL
-    #              https://itunes.apple.com/lookup?id=1460032075
-    lookup_url = f'https://itunes.apple.com/lookup?id={app_id}&country={store}'
+ITUNES_LOOKUP_URL = "https://itunes.apple.com/lookup"
 
-    # Make a GET request to the API
-    response = requests.get(lookup_url)
-    
-    if response.status_code == 200:
-        # Parse the JSON response
-        data = response.json()
-        results = data.get('results')
-        
-        if results:
-            app_info = results[0]  # Assuming the first result is the app we're looking for
-            
-            # Retrieve the required information
-            app_name = app_info.get('trackName')
-            # app_subtitle = app_info.get('subtitle', 'N/A')  # Subtitle might not be available
-            app_description = app_info.get('description')
-            app_update_history = app_info.get('releaseNotes', 'N/A')  # Update history might not be detailed in the lookup API
-            app_icon = app_info.get('artworkUrl512')
-            app_screenshots = app_info.get('screenshotUrls', [])
-            app_release_date = app_info.get('releaseDate', '').split("T")[0]
-            app_update_date = app_info.get('currentVersionReleaseDate', '').split("T")[0]
-            app_rating = app_info.get('averageUserRatingForCurrentVersion', 0)
-            app_rating_count = app_info.get('userRatingCountForCurrentVersion', 0)
-            if len(app_screenshots) == 0 and len(app_info.get('ipadScreenshotUrls', [])) > 0:
-                app_screenshots = app_info.get('ipadScreenshotUrls', [])
+LOOKUP_BATCH_SIZE = 100 # ids per lookup request
 
-            # Prepare the dictionary with the app information
-            app_info_dict = {
-                'name': app_name,
-                # 'subtitle': app_subtitle,
-                'description': app_description,
-                'update_history': app_update_history,
-                'icon': app_icon,
-                'screenshots': app_screenshots,
-                'release': app_release_date,
-                'update': app_update_date,
-                'rating': app_rating,
-                'rating_count': app_rating_count
-            }
-            return app_info_dict
-        else:
-            print(f'No results found for App ID: {app_id}; Store: {store}')
-            return dict()
+def _parse_app_info(app_info: dict) -> dict:
+    # Retrieve the required information
+    app_name = app_info.get('trackName')
+    # app_subtitle = app_info.get('subtitle', 'N/A')  # Subtitle might not be available
+    app_description = app_info.get('description')
+    app_update_history = app_info.get('releaseNotes', 'N/A')  # Update history might not be detailed in the lookup API
+    app_icon = app_info.get('artworkUrl512')
+    app_screenshots = app_info.get('screenshotUrls', [])
+    app_release_date = app_info.get('releaseDate', '').split("T")[0]
+    app_update_date = app_info.get('currentVersionReleaseDate', '').split("T")[0]
+    app_rating = app_info.get('averageUserRatingForCurrentVersion', 0)
+    app_rating_count = app_info.get('userRatingCountForCurrentVersion', 0)
+    if len(app_screenshots) == 0 and len(app_info.get('ipadScreenshotUrls', [])) > 0:
+        app_screenshots = app_info.get('ipadScreenshotUrls', [])
 
-    else:
-        response.raise_for_status()
+    # Prepare the dictionary with the app information
+    return {
+        'name': app_name,
+        # 'subtitle': app_subtitle,
+        'description': app_description,
+        'update_history': app_update_history,
+        'icon': app_icon,
+        'screenshots': app_screenshots,
+        'release': app_release_date,
+        'update': app_update_date,
+        'rating': app_rating,
+        'rating_count': app_rating_count
+    }
+
+def _lookup(store: str, app_ids: list, base_url: str = ITUNES_LOOKUP_URL) -> dict:
+    # App Store lookup API URL, several ids at once
+    #              https://itunes.apple.com/lookup?id=1460032075,1448868559
+    lookup_url = f'{base_url}?id={",".join(app_ids)}&country={store}'
+    response = metadata_cache.get(lookup_url)
+    response.raise_for_status()
+    results = response.json().get('results') or []
+    return {str(result.get('trackId')): _parse_app_info(result) for result in results if result.get('trackId')}
+
+def load_ios_app_infos(app_ids: list, try_stores=["us", "gb"], base_url=ITUNES_LOOKUP_URL) -> dict:
+    # app_id -> app info; each store is asked only for ids the previous stores miss.
+    # Ids every store answered "not found" map to {}, ids left out had a failed lookup and are worth a retry
+    infos = {}
+    missing = list(dict.fromkeys(app_ids))
+    failed = set()
+    for store in try_stores:
+        for start in range(0, len(missing), LOOKUP_BATCH_SIZE):
+            batch = missing[start:start + LOOKUP_BATCH_SIZE]
+            try:
+                infos.update((app_id, info) for app_id, info in _lookup(store, batch, base_url).items() if app_id in batch)
+            except requests.RequestException as e:
+                print(f'Lookup failed for {len(batch)} apps; Store: {store}; {e}')
+                failed.update(batch)
+        missing = [app_id for app_id in missing if app_id not in infos]
+        if not missing: break
+    for app_id in missing:
+        if app_id in failed: continue
+        print(f'No results found for App ID: {app_id}; Stores: {", ".join(try_stores)}')
+        infos[app_id] = {}
+    return infos
 
-def load_ios_app_info(app_id, save_path = None, try_stores=["us", "gb"]):
-    info = None
+def load_ios_app_info(app_id, save_path = None, try_stores=["us", "gb"], base_url=ITUNES_LOOKUP_URL):
+    info = dict()
     for store in try_stores:
-        info = __load_app_info(store=store, app_id=app_id)
+        info = _lookup(store, [app_id], base_url).get(str(app_id), dict())
         if "name" in info: break
+        print(f'No results found for App ID: {app_id}; Store: {store}')
     
     if save_path and info:
         json.dump(info, open(save_path, "w"))
@@ -1,146 +1,182 @@
 import requests
 import json
+from utils import http_client
+from utils.review_store import review_key, take_new_reviews
+from utils.metrics import metrics
+from utils.itunes_feed import loads, parse_feed, feed_pages, page_number
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
 from tqdm.auto import tqdm
 from pathlib import Path
 import os
 
-def get_reviews(store, app_id):
-    base_url = f"https://itunes.apple.com/{store}/rss/customerreviews"
+ITUNES_RSS_URL = "https://itunes.apple.com/{store}/rss/customerreviews"
+# iTunes starts answering 403/429 when hammered, so keep parallel requests per host bounded
+MAX_REQUESTS_PER_HOST = 8
 
-    def fetch(url):
+_host_semaphores = {}
+_host_semaphores_lock = threading.Lock()
+
+def _host_semaphore(url: str) -> threading.BoundedSemaphore:
+    host = urlparse(url).netloc
+    with _host_semaphores_lock:
+        if host not in _host_semaphores:
+            _host_semaphores[host] = threading.BoundedSemaphore(MAX_REQUESTS_PER_HOST)
+        return _host_semaphores[host]
+
+def fetch(url):
+    with _host_semaphore(url):
         try:
-            response = requests.get(url)
+            response = http_client.get(url)
             response.raise_for_status()  # Raise an error for bad statuses
-            return response.json()
+            return loads(response.content)
         except requests.RequestException as e:
             print(f"Request failed: {e}")
             return []
+        except ValueError as e:
+            print(f"Bad JSON from {url}: {e}")
+            return []
 
+def _page_url(base_url, page, app_id):
+    return f"{base_url}/page={page}/id={app_id}/sortby=mostrecent/json"
+
+def get_reviews(store, app_id, page_pool=None, base_url=ITUNES_RSS_URL, known_keys=None):
+    return _get_store_reviews(store, app_id, page_pool, base_url, known_keys)[0]
+
+def _get_store_reviews(store, app_id, page_pool=None, base_url=ITUNES_RSS_URL, known_keys=None, resume_page=None):
+    # returns (new reviews, older reviews from the unfinished part of the last walk,
+    #          page to resume from next time or None when the feed was walked to the end)
+    base_url = base_url.format(store=store)
+    if page_pool is not None and not known_keys:
+        reviews, unfinished_page = _get_reviews_prefetch(base_url, app_id, page_pool, store)
+        return reviews, [], unfinished_page
+
+    # with known reviews pages are walked one by one: usually page 1 already reaches stored ones
+    pbar = tqdm(total=10, desc=f"Store {store}, App ID {app_id}", leave=False) if page_pool is None else None
+    reviews, unfinished_page = _walk_pages(base_url, app_id, store, 1, known_keys=known_keys, pbar=pbar)
+    older_reviews = []
+    if resume_page:
+        # the last walk stopped at a failed page; new reviews pushed the feed down, so the missing
+        # ones are at `resume_page` or later: walk on from there skipping the stored ones
+        skip_keys = set(known_keys or ()) | {review_key(review) for review in reviews}
+        start_page = min(resume_page, unfinished_page or resume_page)
+        older_reviews, unfinished_page = _walk_pages(base_url, app_id, store, start_page, skip_keys=skip_keys, pbar=pbar)
+    if pbar: pbar.close()
+    return reviews, older_reviews, unfinished_page
+
+def _walk_pages(base_url, app_id, store, page, known_keys=None, skip_keys=None, pbar=None):
+    # pages from `page` on until the feed end or the first `known_keys` review;
+    # returns (reviews, page that failed to load or None)
     all_reviews = []
-    has_next_page = True
-    page = 0
-    pbar = tqdm(total=10, desc=f"Store {store}, App ID {app_id}", leave=False)
-    while has_next_page:
-        page += 1
-        url = f"{base_url}/page={page}/id={app_id}/sortby=mostrecent/json"
-        data = fetch(url)
-        if not data: break
-
-        res_data = process_response(data)
-        if not res_data: break
-        next_page = get_page_number_from_data(data, "next")
-        last_page = get_page_number_from_data(data, "last")
-        has_next_page = next_page > page
+    while True:
+        data = fetch(_page_url(base_url, page, app_id))
+        if not data: return all_reviews, page # request failed, see fetch
+
+        res_data = _process_page(data, store)
+        if not res_data: return all_reviews, None
+        pages = feed_pages(data)
+        next_page, last_page = pages.get("next", -1), pages.get("last", -1)
+        if skip_keys: res_data = [review for review in res_data if review_key(review) not in skip_keys]
+        res_data, reached_known = take_new_reviews(res_data, known_keys)
         all_reviews += res_data
 
-        pbar.total = last_page
-        pbar.update()
-        # print(f"Loaded: {page}/{last_page}")
-
-    return all_reviews
-
-def process_response(data) -> dict:
-    reviews = data.get('feed', {}).get('entry')
-    if isinstance(reviews, dict):
-        reviews = [reviews]
-    if not reviews: 
-        feed = data.get('feed', {})
-        if "author" in feed:
-            reviews = [feed]
-    
-    if not reviews: return None
-
-    result = []
-    for elem in reviews:
-        elem = Hasher(elem)
-
-        total_rating_obj = elem["im:voteCount"]["label"]
-        total_rating = 0
-        try:
-            total_rating = int(total_rating_obj)
-        except:
-            # Handle the exception
-            continue
-
-        usefull_rating = int(elem["im:voteSum"]["label"])
-        useless_rating = total_rating-usefull_rating
-        rating = int(elem["im:rating"]["label"])
-        review = {
-            "author":elem["author"]["name"]["label"],
-            "date":elem["updated"]["label"],
-            "rating":rating,
-            "app_version":elem["im:version"]["label"],
-            "title":elem["title"]["label"],
-            "content":elem["content"]["label"]
-        }
-
-        if usefull_rating > 0:
-            review["usefull"] = usefull_rating
-        if useless_rating > 0:
-            review["useless"] = useless_rating
-
-        result.append(review)
-
-    return result
+        if pbar:
+            pbar.total = last_page
+            pbar.update()
+        if reached_known or next_page <= page: return all_reviews, None
+        page += 1
 
+def _process_page(data, store):
+    with metrics.stage("parse"):
+        res_data, malformed = parse_feed(data)
+    metrics.incr("review_pages", store=store)
+    if malformed:
+        metrics.incr("malformed_entries", malformed, store=store)
+    return res_data
+
+def _get_reviews_prefetch(base_url, app_id, page_pool, store):
+    # Page 1 tells how many pages the store has ("last" link), the rest are requested at once.
+    # Pages are consumed in order with the same stop rules as the sequential loop, so the result is identical.
+    data = fetch(_page_url(base_url, 1, app_id))
+    if not data: return [], 1
+    res_data = _process_page(data, store)
+    if not res_data: return [], None
+
+    all_reviews = list(res_data)
+    pages = feed_pages(data)
+    next_page, last_page = pages.get("next", -1), pages.get("last", -1)
+    page = 1
+    if next_page > page:
+        futures = {p: page_pool.submit(fetch, _page_url(base_url, p, app_id)) for p in range(2, last_page + 1)}
+        try:
+            while next_page > page:
+                page += 1
+                future = futures.get(page)
+                data = future.result() if future else fetch(_page_url(base_url, page, app_id))
+                if not data: return all_reviews, page
+
+                res_data = _process_page(data, store)
+                if not res_data: break
+                next_page = get_page_number_from_data(data, "next")
+                all_reviews += res_data
+        finally:
+            for future in futures.values():
+                future.cancel()
+
+    return all_reviews, None
+
+def process_response(data) -> list:
+    reviews, _ = parse_feed(data)
+    return reviews
 
 def get_page_number_from_data(data: dict, name: str) -> int:
-    feed = data["feed"]
-    if not feed: return -1
-
-    next_page_link = [link["attributes"]["href"] 
-                      for link in feed["link"] 
-                      if link["attributes"]["rel"] == name][0]
-    page_number = get_page_number(next_page_link)
-    return page_number
+    return feed_pages(data).get(name, -1)
 
 def check_has_next_page(page_number: int, data: dict) -> bool:
-    feed = data["feed"]
-    if not feed: return False
-
-    next_page_link = [link["attributes"]["href"] 
-                      for link in feed["link"] 
-                      if link["attributes"]["rel"] == "next"][0]
-    next_page_number = get_page_number(next_page_link)
-    result = next_page_number == page_number
-    return result
+    return get_page_number_from_data(data, "next") == page_number
 
 def get_page_number(url: str) -> int:
-    # Find the starting index of "page="
-    start_index = url.find('page=') + len('page=')
-
-    # If "page=" is found, continue to find the page number
-    if start_index != -1:
-        # Find the end index, which is the next "/" after "page="
-        end_index = url.find('/', start_index)
-
-        # Extract the page number using slicing
-        if end_index != -1:
-            page_number = url[start_index:end_index]
-        else:
-            # If there is no "/" after "page=", take the rest of the string
-            page_number = url[start_index:]
-
-        # Convert the page number to an integer and print it
-        page_number = int(page_number)
-        return page_number
-    else:
-        return -1
+    return page_number(url)
 
+def _load_store_reviews(store, app_id, page_pool, base_url, review_store):
+    if not review_store:
+        reviews = get_reviews(store=store, app_id=app_id, page_pool=page_pool, base_url=base_url)
+    else:
+        # continuation of an iOS store = page the last walk failed on, so a transient 403/429 does not leave a gap
+        known_keys = review_store.known_keys("ios", app_id, store)
+        resume_page = (review_store.get_continuation("ios", app_id, store) or {}).get("resume_page")
+        new_reviews, older_reviews, unfinished_page = _get_store_reviews(store, app_id, page_pool, base_url, known_keys, resume_page)
+        review_store.add_reviews("ios", app_id, store, new_reviews)
+        review_store.add_reviews("ios", app_id, store, older_reviews, older=True)
+        if unfinished_page or resume_page:
+            review_store.set_continuation("ios", app_id, store, {"resume_page": unfinished_page})
+        if unfinished_page:
+            print(f"Store {store}: pages from {unfinished_page} failed to load, the next run goes on from there")
+            metrics.incr("unfinished_walks", app_id=app_id, store=store)
+        reviews = review_store.load_reviews("ios", app_id, store)
+    for review in reviews:
+        review["store"] = store
+    return reviews
 
-# for easy access to nested elements
-class Hasher(dict):
-    # https://stackoverflow.com/a/3405143/190597
-    def __missing__(self, key):
-        value = self[key] = type(self)()
-        return value
-
-def load_ios_reviews(app_id, save_path=None, stores=["us", "ca", "au", "ru", "it", "in", "fr", "gb", "ua", "jp", "cn", "tw", "my", "de"]):
+def load_ios_reviews(app_id, save_path=None, stores=["us", "ca", "au", "ru", "it", "in", "fr", "gb", "ua", "jp", "cn", "tw", "my", "de"], max_workers=8, base_url=ITUNES_RSS_URL, review_store=None):
     reviews = []
-    pbar = tqdm(stores)
-    for store in pbar:
-        pbar.set_description_str(f"Load from store: {store}")
-        reviews += get_reviews(store=store, app_id=app_id)
+    if max_workers <= 1:
+        pbar = tqdm(stores)
+        for store in pbar:
+            pbar.set_description_str(f"Load from store: {store}")
+            reviews += _load_store_reviews(store, app_id, None, base_url, review_store)
+    else:
+        # stores run in parallel, each store prefetches its pages; per host limit is in `fetch`
+        with ThreadPoolExecutor(max_workers=max_workers) as store_pool, \
+             ThreadPoolExecutor(max_workers=MAX_REQUESTS_PER_HOST) as page_pool:
+            futures = [store_pool.submit(_load_store_reviews, store, app_id, page_pool, base_url, review_store)
+                       for store in stores]
+            pbar = tqdm(total=len(stores), desc="Load from stores")
+            for future in futures:
+                reviews += future.result()
+                pbar.update()
+            pbar.close()
     if save_path:
         json.dump(reviews, open(save_path, "w"), ensure_ascii=False)
     return reviews
@@ -0,0 +1,140 @@
+import base64, hashlib, json, os, threading, time
+import requests
+from requests.structures import CaseInsensitiveDict
+from utils import http_client
+from utils.metrics import metrics
+
+# Cache for app metadata (iTunes lookup, SensorTower pages, Google Play app info).
+# Fresh entries (younger than TTL) cost nothing; older ones are revalidated with
+# If-None-Match / If-Modified-Since, so an unchanged page costs a 304 without body.
+# When revalidation fails (request error or an answer other than 200/304) the stale entry is used.
+# Values without HTTP access (google_play_scraper) are cached by TTL only.
+# Module level like http_client: `configure()` once in main, loaders call `get()` / `get_value()`.
+
+class MetadataCache:
+    def __init__(self, folder: str, ttl_seconds: float = 24 * 3600):
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        self.stats = {"fresh": 0, "not_modified": 0, "modified": 0, "misses": 0, "stale": 0}
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.folder, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json")
+
+    def _read(self, key: str):
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get("key") == key else None
+
+    def _write(self, key: str, entry: dict):
+        entry["key"] = key
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(entry, file, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _count(self, name: str):
+        with self.lock: self.stats[name] += 1
+        metrics.incr("metadata_cache", result=name)
+
+    def _is_fresh(self, entry: dict) -> bool:
+        return time.time() - entry["stored"] < self.ttl_seconds
+
+    def get(self, url: str, read=None, **kwargs) -> requests.Response:
+        # GET through the cache; only 200 answers are stored.
+        # `read(response) -> bytes` stores only the part of the body the caller needs (use with stream=True)
+        entry = self._read(url)
+        if entry and self._is_fresh(entry):
+            self._count("fresh")
+            return _cached_response(url, entry)
+
+        headers = dict(kwargs.pop("headers", None) or {})
+        if entry and entry.get("etag"): headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"): headers["If-Modified-Since"] = entry["last_modified"]
+        try:
+            response = http_client.get(url, headers=headers, **kwargs)
+        except requests.RequestException as e:
+            if not entry: raise
+            return self._stale(url, entry, e)
+
+        if entry and response.status_code == 304:
+            self._count("not_modified")
+            entry["stored"] = time.time()
+            self._write(url, entry)
+            return _cached_response(url, entry)
+
+        if entry and response.status_code != 200:
+            response.close()
+            return self._stale(url, entry, f"status code {response.status_code}")
+        self._count("modified" if entry else "misses")
+        if response.status_code != 200: return response
+        body = read(response) if read else response.content
+        entry = {"stored": time.time(),
+                 "etag": response.headers.get("ETag"),
+                 "last_modified": response.headers.get("Last-Modified"),
+                 "content_type": response.headers.get("Content-Type"),
+                 "encoding": response.encoding,
+                 "body": base64.b64encode(body).decode("ascii")}
+        self._write(url, entry)
+        return _response(url, body, response.encoding, entry["content_type"]) if read else response
+
+    def _stale(self, url: str, entry: dict, reason) -> requests.Response:
+        # a cached answer older than the TTL is better than none
+        print(f"Revalidation failed, using the cached copy of {url}: {reason}")
+        self._count("stale")
+        return _cached_response(url, entry)
+
+    def get_value(self, key: str):
+        # TTL only cached value or None
+        entry = self._read(key)
+        if entry and self._is_fresh(entry):
+            self._count("fresh")
+            return entry["value"]
+        self._count("misses")
+        return None
+
+    def set_value(self, key: str, value):
+        self._write(key, {"stored": time.time(), "value": value})
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return dict(self.stats)
+
+def _response(url: str, body: bytes, encoding, content_type) -> requests.Response:
+    response = requests.Response()
+    response.status_code = 200
+    response.url = url
+    response._content = body
+    response.encoding = encoding
+    response.headers = CaseInsensitiveDict({"Content-Type": content_type or ""})
+    return response
+
+def _cached_response(url: str, entry: dict) -> requests.Response:
+    return _response(url, base64.b64decode(entry["body"]), entry.get("encoding"), entry.get("content_type"))
+
+_cache = None
+
+def configure(folder: str, ttl_seconds: float = 24 * 3600):
+    global _cache
+    _cache = MetadataCache(folder, ttl_seconds) if folder else None
+
+def get(url: str, read=None, **kwargs) -> requests.Response:
+    if _cache is not None: return _cache.get(url, read=read, **kwargs)
+    response = http_client.get(url, **kwargs)
+    if read and response.status_code == 200:
+        return _response(url, read(response), response.encoding, response.headers.get("Content-Type"))
+    return response
+
+def get_value(key: str):
+    return _cache.get_value(key) if _cache else None
+
+def set_value(key: str, value):
+    if _cache: _cache.set_value(key, value)
+
+def get_stats():
+    return _cache.get_stats() if _cache else None
@@ -0,0 +1,95 @@
+import json, os, threading, time
+from contextlib import contextmanager
+
+# Lightweight run instrumentation: stage wall time and counters with labels.
+# One process-wide `metrics` object, dumped as JSON (and Prometheus textfile) at the end of a run.
+
+def _labels_key(labels: dict) -> tuple:
+    return tuple(sorted((key, str(value)) for key, value in labels.items() if value is not None))
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.stages = {} # (name, labels) -> [count, seconds, max_seconds]
+            self.counters = {} # (name, labels) -> value
+
+    @contextmanager
+    def stage(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start, **labels)
+
+    def add_time(self, name: str, seconds: float, **labels):
+        key = (name, _labels_key(labels))
+        with self.lock:
+            entry = self.stages.setdefault(key, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+
+    def incr(self, name: str, value: float = 1, **labels):
+        key = (name, _labels_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def stage_totals(self) -> dict:
+        # seconds per stage name summed over labels
+        totals = {}
+        with self.lock:
+            for (name, _), (_, seconds, _) in self.stages.items():
+                totals[name] = totals.get(name, 0.0) + seconds
+        return totals
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            stages = [{"stage": name, "labels": dict(labels), "count": count, "seconds": round(seconds, 4), "max_seconds": round(max_seconds, 4)}
+                      for (name, labels), (count, seconds, max_seconds) in sorted(self.stages.items())]
+            counters = [{"name": name, "labels": dict(labels), "value": value}
+                        for (name, labels), value in sorted(self.counters.items())]
+            return {"started": self.started, "wall_seconds": round(time.time() - self.started, 4),
+                    "stages": stages, "counters": counters}
+
+    def write_json(self, path: str):
+        # written atomically, readers of a file rewritten every --watch cycle never see half of it
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(self.to_dict(), file, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def write_prometheus(self, path: str, prefix: str = "review_analyzer"):
+        # node_exporter textfile collector format, written atomically
+        def labels_text(labels):
+            if not labels: return ""
+            return "{" + ",".join(f'{key}="{_escape_label(value)}"' for key, value in labels) + "}"
+
+        data_lines = []
+        with self.lock:
+            data_lines.append(f"# TYPE {prefix}_stage_seconds_total counter")
+            for (name, labels), (_, seconds, _) in sorted(self.stages.items()):
+                data_lines.append(f"{prefix}_stage_seconds_total{labels_text((('stage', name),) + labels)} {seconds:.6f}")
+            data_lines.append(f"# TYPE {prefix}_stage_runs_total counter")
+            for (name, labels), (count, _, _) in sorted(self.stages.items()):
+                data_lines.append(f"{prefix}_stage_runs_total{labels_text((('stage', name),) + labels)} {count}")
+            for (name, labels), value in sorted(self.counters.items()):
+                data_lines.append(f"{prefix}_{name}_total{labels_text(labels)} {value}")
+            data_lines.append(f"{prefix}_run_wall_seconds {time.time() - self.started:.6f}")
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as file:
+            file.write("\n".join(data_lines) + "\n")
+        os.replace(tmp_path, path)
+
+def _escape_label(value) -> str:
+    # exposition format: \\ \" and \n are the only escapes, an unescaped quote breaks the whole file
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+metrics = Metrics()
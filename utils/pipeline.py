@@ -0,0 +1,321 @@
+import os, traceback
+from concurrent.futures import ThreadPoolExecutor
+from utils.create_html import create_html
+from utils.metrics import metrics
+from utils.dedup import dedup_reviews
+from utils.review_table import ReviewTable
+from utils.sampling import stratified_order, stratum_coverage
+from utils.incremental import analyze_incremental, fingerprint
+
+# Per app stages: info -> reviews -> GPT analysis (+ sensortower in parallel) -> HTML.
+# Apps run in a worker pool, so network waits and GPT calls of different apps overlap.
+# Loaders (requests, tqdm, google_play_scraper), export and clustering are imported by the stages
+# that use them, so an iOS only run or a report re-render does not load the rest.
+
+def is_appstore_id(app_id: str) -> bool:
+    return app_id.isdigit() and len(app_id) > 5
+
+def prefetch_info_stage(app_ids: list, journal=None) -> dict:
+    # App Store infos of the whole batch in a few bulk lookups; {} = not found in any store.
+    # Only apps missing here (their bulk lookup failed) are loaded one by one later
+    ios_ids = [app_id for app_id in app_ids if is_appstore_id(app_id) and not (journal and journal.load(app_id, "info"))]
+    if not ios_ids: return {}
+    from utils.load_app_info import load_ios_app_infos
+    with metrics.stage("app_info_bulk"):
+        return load_ios_app_infos(ios_ids)
+
+def load_info_stage(app_id: str, prefetched: dict = None) -> dict:
+    is_appstore = is_appstore_id(app_id)
+    if prefetched and app_id in prefetched:
+        return prefetched[app_id] # {} when the bulk lookup found nothing in any store
+    print(f"Load app info: {app_id} ({'AppStore' if is_appstore else 'GooglePlay'})")
+    if is_appstore:
+        from utils.load_app_info import load_ios_app_info
+        return load_ios_app_info(app_id)
+    else:
+        from utils.load_android_app_info import load_android_app_info
+        return load_android_app_info(app_id)
+
+def load_reviews_stage(app_id: str, app_info: dict, args, review_store=None) -> list:
+    is_appstore = is_appstore_id(app_id)
+    if is_appstore:
+        from utils.load_reviews import load_ios_reviews
+        app_reviews = load_ios_reviews(app_id, stores=args.stores, review_store=review_store)
+    else:
+        from utils.load_android_reviews import load_android_reviews
+        app_reviews = load_android_reviews(app_id, review_store=review_store, max_pages=args.android_pages)
+
+    if not args.no_dedup:
+        app_reviews, dedup_stats = dedup_reviews(app_reviews, near_duplicates=args.near_duplicates)
+        dropped = dedup_stats["exact_duplicates"] + dedup_stats["near_duplicates"]
+        print(f"{app_id}: dropped {dropped} duplicated reviews ({dedup_stats['exact_duplicates']} exact, {dedup_stats['near_duplicates']} near) of {dedup_stats['total']}")
+        metrics.incr("duplicates_dropped", dedup_stats["exact_duplicates"], app_id=app_id, kind="exact")
+        metrics.incr("duplicates_dropped", dedup_stats["near_duplicates"], app_id=app_id, kind="near")
+    if is_appstore:
+        app_info["reviews_count"] = len(app_reviews)
+    return app_reviews
+
+def _report_coverage(name: str, app_id: str, all_reviews, selected_reviews):
+    coverage = stratum_coverage(all_reviews, selected_reviews)
+    print(f"{name}: coverage " + ", ".join(f"{key} {entry['selected']}/{entry['total']}" for key, entry in coverage.items()))
+    for key, entry in coverage.items():
+        metrics.incr("reviews_selected", entry["selected"], app_id=app_id, stratum=key)
+
+def _prompt_app_info(app_info: dict) -> dict:
+    return {key: value for key, value in app_info.items()
+            if key not in ('icon', 'screenshots', 'description')} # With description it take Pros from it
+
+def _ordered_reviews(app_reviews, args):
+    # returns (view of all reviews, same reviews in the order they should go to GPT)
+    table = ReviewTable.from_dicts(app_reviews)
+    content, title = table.content, table.title
+    all_reviews = table.view()
+    if args.selection == "stratified":
+        return all_reviews, all_reviews.take(stratified_order(all_reviews))
+    # reviews with more symbols othen cares more info about app
+    return all_reviews, all_reviews.sorted(key=lambda idx: len(content[idx]) + len(title[idx] or ""), reverse=True)
+
+def _select(process_app_info: dict, reviews_view, gpt, args):
+    selected, token_stats = gpt.select_reviews(app_info=process_app_info,
+                                               reviews=reviews_view,
+                                               reserve_output_tokens=args.reserve_output_tokens,
+                                               input_budget=args.max_input_tokens,
+                                               max_reviews=args.max_reviews)
+    print(f"{process_app_info['name']}: selected {token_stats['selected']}/{token_stats['total']} reviews; {token_stats['used_tokens']}/{token_stats['available_tokens']} input tokens")
+    return reviews_view.take(selected)
+
+def _by_date(reviews_view):
+    date = reviews_view.table.date
+    return reviews_view.sorted(key=lambda idx: date[idx], reverse=True)
+
+def select_stage(app_info: dict, app_reviews: list, gpt, args, app_id: str = None):
+    # returns (app info for the prompt, ReviewView of reviews to analyze sorted by date, cluster summaries or None)
+    process_app_info = _prompt_app_info(app_info)
+    all_reviews, reviews_view = _ordered_reviews(app_reviews, args)
+    clusters = None
+    if args.cluster:
+        # similar reviews collapse into one representative with cluster_size, biggest clusters first
+        from utils.clustering import cluster_reviews
+        reviews_view, clusters = cluster_reviews(reviews_view, max_clusters=args.max_clusters)
+        print(f"{app_info['name']}: {len(all_reviews)} reviews grouped into {len(clusters)} clusters")
+    if not args.map_reduce:
+        reviews_view = _select(process_app_info, reviews_view, gpt, args)
+        _report_coverage(app_info['name'], app_id, all_reviews, reviews_view)
+    return process_app_info, _by_date(reviews_view), clusters
+
+def analyze_stage(app_info: dict, app_reviews: list, gpt, args, app_id: str = None, review_store=None):
+    # returns (analysis, ReviewView of reviews used for analysis sorted by date)
+    if args.incremental and review_store and app_id:
+        process_app_info = _prompt_app_info(app_info)
+        all_reviews, reviews_view = _ordered_reviews(app_reviews, args)
+        platform = "ios" if is_appstore_id(app_id) else "android"
+        analysis, reviews_view = analyze_incremental(app_id, platform, process_app_info, reviews_view, gpt, args, review_store,
+                                                     select=lambda info, view: _select(info, view, gpt, args))
+        _report_coverage(app_info['name'], app_id, all_reviews, reviews_view)
+        return analysis, _by_date(reviews_view)
+
+    process_app_info, reviews_view, clusters = select_stage(app_info, app_reviews, gpt, args, app_id)
+    if args.map_reduce:
+        analysis = gpt.process_reviews_map_reduce(app_info=process_app_info,
+                                                  reviews=reviews_view,
+                                                  reserve_output_tokens=args.reserve_output_tokens,
+                                                  chunk_tokens=args.max_input_tokens,
+                                                  max_workers=args.max_gpt_concurrency)
+    else:
+        analysis = gpt.process_reviews(app_info=process_app_info, reviews=reviews_view)
+    # analysis = gpt.get_debug_analysis()
+    if clusters: analysis["clusters"] = clusters
+    return analysis, reviews_view
+
+def render_stage(app_id: str, app_info: dict, analysis: dict, app_reviews: list, sensor_info: dict, args) -> str:
+    is_appstore = is_appstore_id(app_id)
+    dir_path = os.path.abspath(args.save_folder)
+    os.makedirs(dir_path, exist_ok=True)
+    platform_prefix = "ios" if is_appstore else "android"
+    name = f"{platform_prefix}_{app_id}_{app_info['name']}.html"
+    name = name.replace(" ", "_")
+    file_name = os.path.join(dir_path, name)
+    create_html(app_analysis=analysis["app_analysis"],
+                app_info=app_info,
+                app_reviews=app_reviews,
+                sensortower_info=sensor_info,
+                save_to_path=file_name,
+                open_html_page=not args.no_browser,
+                clusters=analysis.get("clusters"),
+                app_id=app_id,
+                is_appstore=is_appstore)
+    return file_name
+
+def export_stage(app_id: str, app_reviews: list, args) -> dict:
+    from utils.review_export import export_reviews
+    platform = "ios" if is_appstore_id(app_id) else "android"
+    written = export_reviews(app_reviews, args.export_folder, platform, app_id, fmt=args.export_format)
+    print(f"{app_id}: exported {len(app_reviews)} reviews to {len(written)} partitions in {os.path.abspath(args.export_folder)}")
+    return written
+
+def sensortower_stage(app_id: str, journal=None) -> dict:
+    from utils.sensortower import get_revenue_and_downloads
+    with metrics.stage("sensortower", app_id=app_id):
+        sensor_info = get_revenue_and_downloads(app_id=app_id)
+    if journal: journal.save(app_id, "sensortower", sensor_info)
+    return sensor_info
+
+def _restored(journal, app_id: str, stage: str):
+    value = journal.load(app_id, stage) if journal else None
+    if value is not None:
+        print(f"{app_id}: {stage} restored from the run journal")
+        metrics.incr("stages_resumed", app_id=app_id, stage=stage)
+    return value
+
+def process_app(app_id: str, args, gpt, review_store=None, side_pool=None, journal=None, prefetched_info=None, reported=None,
+                report_journal=None) -> dict:
+    # with a journal every finished stage is checkpointed and stages with a checkpoint are not run again;
+    # `reported` (app_id -> (reviews fingerprint, report file), kept between --watch cycles) skips
+    # analysis and HTML when the reviews are the same as in the last report;
+    # `report_journal` only keeps what `render` needs of every report built (--watch), nothing is restored from it
+    html = _restored(journal, app_id, "html")
+    if html and os.path.exists(html["file"]):
+        return {"status": "done", "file": html["file"]}
+
+    app_info = _restored(journal, app_id, "info")
+    if app_info is None:
+        with metrics.stage("app_info", app_id=app_id):
+            app_info = load_info_stage(app_id, prefetched_info)
+        if not app_info or "name" not in app_info:
+            print(f"Can't load app info: {app_id}; Break")
+            return {"status": "skipped", "reason": "no app info"}
+        if journal: journal.save(app_id, "info", app_info)
+    print(f"Info loaded for app: {app_info['name']};\nStart load reviews..")
+
+    # sensortower only needs app_id, load it while reviews are fetched and analyzed
+    sensor_info = _restored(journal, app_id, "sensortower")
+    sensor_future = side_pool.submit(sensortower_stage, app_id, journal) if side_pool and sensor_info is None else None
+
+    app_reviews = _restored(journal, app_id, "reviews")
+    if app_reviews is None:
+        with metrics.stage("reviews", app_id=app_id):
+            app_reviews = load_reviews_stage(app_id, app_info, args, review_store)
+        metrics.incr("reviews_loaded", len(app_reviews), app_id=app_id)
+        if args.export_folder:
+            with metrics.stage("export", app_id=app_id):
+                export_stage(app_id, app_reviews, args)
+        if journal:
+            journal.save(app_id, "reviews", app_reviews)
+            journal.save(app_id, "info", app_info) # reviews stage adds reviews_count
+    if len(app_reviews) > 5:
+        print(f"{app_info['name']}: {len(app_reviews)} reviews of the app have been downloaded; Start analyzing..")
+    else:
+        print(f"There are not enough reviews to analyze the app {app_id}. You can look at them yourself.\n{app_reviews}")
+        print("Break!")
+        return {"status": "skipped", "reason": "not enough reviews"}
+
+    reviews_fingerprint = fingerprint(app_reviews, salt=str(app_info.get("update"))) if reported is not None else None
+    if reported and app_id in reported:
+        last_fingerprint, last_file = reported[app_id]
+        if last_fingerprint == reviews_fingerprint and os.path.exists(last_file):
+            if sensor_future: sensor_future.cancel()
+            print(f"{app_info['name']}: no new reviews since the last report: {last_file}")
+            return {"status": "unchanged", "file": last_file}
+
+    checkpoint = _restored(journal, app_id, "analysis")
+    if checkpoint is not None:
+        analysis, app_reviews = checkpoint["analysis"], checkpoint["reviews"]
+    else:
+        with metrics.stage("analysis", app_id=app_id):
+            analysis, app_reviews = analyze_stage(app_info, app_reviews, gpt, args, app_id, review_store)
+        metrics.incr("reviews_analyzed", len(app_reviews), app_id=app_id)
+        if journal: journal.save(app_id, "analysis", {"analysis": analysis, "reviews": app_reviews.to_dicts()})
+    if sensor_info is None:
+        sensor_info = sensor_future.result() if sensor_future else sensortower_stage(app_id, journal)
+    print(f"Analyze is done:\n{analysis}")
+    print(f"Prepare HTML..")
+
+    with metrics.stage("html", app_id=app_id):
+        file_name = render_stage(app_id, app_info, analysis, app_reviews, sensor_info, args)
+    if journal: journal.save(app_id, "html", {"file": file_name})
+    if report_journal:
+        report_journal.save(app_id, "info", app_info)
+        report_journal.save(app_id, "sensortower", sensor_info)
+        report_journal.save(app_id, "analysis", {"analysis": analysis, "reviews": app_reviews.to_dicts()})
+        report_journal.save(app_id, "html", {"file": file_name})
+    if reported is not None: reported[app_id] = (reviews_fingerprint, file_name)
+    print(f"Done: {app_info['name']};\nResult saved to: {file_name}")
+    return {"status": "done", "file": file_name}
+
+def fetch_app(app_id: str, args, review_store=None, prefetched_info=None) -> dict:
+    # `fetch` command: app info and new reviews into the review store (and export), no GPT
+    with metrics.stage("app_info", app_id=app_id):
+        app_info = load_info_stage(app_id, prefetched_info)
+    if not app_info or "name" not in app_info:
+        print(f"Can't load app info: {app_id}; Break")
+        return {"status": "skipped", "reason": "no app info"}
+    with metrics.stage("reviews", app_id=app_id):
+        app_reviews = load_reviews_stage(app_id, app_info, args, review_store)
+    metrics.incr("reviews_loaded", len(app_reviews), app_id=app_id)
+    if args.export_folder:
+        with metrics.stage("export", app_id=app_id):
+            export_stage(app_id, app_reviews, args)
+    print(f"Done: {app_info['name']}; {len(app_reviews)} reviews")
+    return {"status": "done", "reviews": len(app_reviews)}
+
+def render_app(app_id: str, args, journal) -> dict:
+    # `render` command: HTML from the info, analysis and sensortower checkpoints of the last run, no network
+    app_info = journal.load(app_id, "info")
+    checkpoint = journal.load(app_id, "analysis")
+    if app_info is None or checkpoint is None:
+        print(f"{app_id}: no analysis in the run journal, run analyze first")
+        return {"status": "skipped", "reason": "not analyzed"}
+    sensor_info = journal.load(app_id, "sensortower") or {"downloads": "-", "revenue": "-"}
+    with metrics.stage("html", app_id=app_id):
+        file_name = render_stage(app_id, app_info, checkpoint["analysis"], checkpoint["reviews"], sensor_info, args)
+    journal.save(app_id, "html", {"file": file_name})
+    print(f"Done: {app_info['name']};\nResult saved to: {file_name}")
+    return {"status": "done", "file": file_name}
+
+def _isolated(function, app_id: str, *args) -> dict:
+    try:
+        return function(app_id, *args)
+    except Exception as e:
+        # one broken app should not stop the whole batch
+        traceback.print_exc()
+        print(f"Failed: {app_id}; {type(e).__name__}: {e}")
+        return {"status": "failed", "reason": f"{type(e).__name__}: {e}"}
+
+def _prefetch_info(app_ids: list, journal=None) -> dict:
+    try:
+        return prefetch_info_stage(app_ids, journal)
+    except Exception as e:
+        print(f"Bulk app info lookup failed, apps will be looked up one by one; {type(e).__name__}: {e}")
+        return {}
+
+def _report_results(results: dict):
+    for result in results.values():
+        metrics.incr("apps", status=result["status"])
+    for status in ("done", "unchanged", "skipped", "failed"):
+        ids = [app_id for app_id, result in results.items() if result["status"] == status]
+        if ids: print(f"{status.capitalize()}: {len(ids)} ({', '.join(ids)})")
+
+def run_apps(app_ids: list, args, gpt, review_store=None, journal=None, reported=None, report_journal=None) -> dict:
+    workers = max(1, min(args.workers, len(app_ids)))
+    prefetched_info = _prefetch_info(app_ids, journal)
+    with ThreadPoolExecutor(max_workers=workers) as app_pool, \
+         ThreadPoolExecutor(max_workers=workers) as side_pool:
+        futures = {app_id: app_pool.submit(_isolated, process_app, app_id, args, gpt, review_store, side_pool, journal, prefetched_info, reported, report_journal)
+                   for app_id in app_ids}
+        results = {app_id: future.result() for app_id, future in futures.items()}
+    _report_results(results)
+    return results
+
+def fetch_apps(app_ids: list, args, review_store=None) -> dict:
+    workers = max(1, min(args.workers, len(app_ids)))
+    prefetched_info = _prefetch_info(app_ids)
+    with ThreadPoolExecutor(max_workers=workers) as app_pool:
+        futures = {app_id: app_pool.submit(_isolated, fetch_app, app_id, args, review_store, prefetched_info) for app_id in app_ids}
+        results = {app_id: future.result() for app_id, future in futures.items()}
+    _report_results(results)
+    return results
+
+def render_apps(app_ids: list, args, journal) -> dict:
+    results = {app_id: _isolated(render_app, app_id, args, journal) for app_id in app_ids}
+    _report_results(results)
+    return results
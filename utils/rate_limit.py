@@ -0,0 +1,62 @@
+import asyncio, random, threading, time
+from email.utils import parsedate_to_datetime
+
+# Token buckets for OpenAI org limits (requests/min and tokens/min), usable from threads and asyncio
+
+class TokenBucket:
+    def __init__(self, per_minute: float, capacity: float = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity else per_minute
+        self.available = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        # takes `amount` right away (bucket may go into debt), returns seconds to wait before using it
+        amount = min(amount, self.capacity)
+        with self.lock:
+            now = time.monotonic()
+            self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+            self.updated = now
+            self.available -= amount
+            return max(0.0, -self.available / self.rate)
+
+class RateLimiter:
+    def __init__(self, requests_per_minute: float = None, tokens_per_minute: float = None):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+    def reserve(self, tokens: int = 0) -> float:
+        wait = 0.0
+        if self.requests: wait = max(wait, self.requests.reserve(1))
+        if self.tokens and tokens: wait = max(wait, self.tokens.reserve(tokens))
+        return wait
+
+    def acquire(self, tokens: int = 0):
+        wait = self.reserve(tokens)
+        if wait > 0: time.sleep(wait)
+
+    async def acquire_async(self, tokens: int = 0):
+        wait = self.reserve(tokens)
+        if wait > 0: await asyncio.sleep(wait)
+
+def backoff_delay(attempt: int, base_delay: float = 1.0, max_delay: float = 60.0, retry_after: float = None) -> float:
+    # server hint wins; otherwise exponential backoff with full jitter
+    if retry_after is not None:
+        return min(max_delay, retry_after + random.uniform(0, base_delay / 2))
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+def parse_retry_after(headers) -> float:
+    # "retry-after-ms" (OpenAI) / "retry-after" in seconds or as HTTP date
+    if not headers: return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if value is None: return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
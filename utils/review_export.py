@@ -0,0 +1,135 @@
+import gzip, json, os
+
+try:
+    import pyarrow
+    import pyarrow.parquet as parquet
+except ImportError:
+    pyarrow = None
+
+# Export of collected reviews for analytics jobs, hive style partitions:
+#   <folder>/platform=ios/app_id=123/store=us/month=2024-05/reviews.jsonl.gz (or reviews.parquet)
+# Partitions are filtered by path before opening a file, parquet files are read only for the needed columns.
+# Every export rewrites the partitions it has reviews for: the review cache already holds the whole history.
+
+EXPORT_FORMATS = ("jsonl", "parquet")
+EXPORT_FIELDS = ("author", "date", "rating", "app_version", "title", "content", "usefull", "useless", "store")
+_FILE_NAMES = {"jsonl": "reviews.jsonl.gz", "parquet": "reviews.parquet"}
+_INT_FIELDS = ("rating", "usefull", "useless")
+
+def _partition_value(value) -> str:
+    value = str(value) if value not in (None, "") else "unknown"
+    return value.replace("/", "_").replace("=", "_")
+
+def _review_month(review) -> str:
+    # "2024-05-17" (Google Play) and "2024-05-17T10:00:00-07:00" (App Store) both start with the month
+    date = str(review.get("date") or "")
+    return date[:7] if len(date) >= 7 else "unknown"
+
+def _partition_path(folder, platform, app_id, store, month) -> str:
+    return os.path.join(folder, f"platform={_partition_value(platform)}", f"app_id={_partition_value(app_id)}",
+                        f"store={_partition_value(store)}", f"month={_partition_value(month)}")
+
+def _write_jsonl(path, rows):
+    with gzip.open(path, "wt", encoding="utf-8", compresslevel=6) as file:
+        for row in rows:
+            file.write(json.dumps(row, ensure_ascii=False, separators=(",", ":")))
+            file.write("\n")
+
+def _write_parquet(path, rows):
+    columns = {field: [row.get(field) for row in rows] for field in EXPORT_FIELDS}
+    schema = pyarrow.schema([(field, pyarrow.int64() if field in _INT_FIELDS else pyarrow.string()) for field in EXPORT_FIELDS])
+    table = pyarrow.Table.from_pydict(columns, schema=schema)
+    parquet.write_table(table, path, compression="zstd")
+
+def check_format(fmt: str):
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}; use one of {', '.join(EXPORT_FORMATS)}")
+    if fmt == "parquet" and pyarrow is None:
+        raise ImportError("Parquet export needs pyarrow: pip install pyarrow")
+
+def export_reviews(reviews, folder: str, platform: str, app_id: str, fmt: str = "jsonl") -> dict:
+    # reviews: dicts or ReviewView rows; returns {partition path: review count}
+    check_format(fmt)
+    partitions = {}
+    for review in reviews:
+        row = {field: review.get(field) for field in EXPORT_FIELDS}
+        partitions.setdefault((row["store"], _review_month(row)), []).append(row)
+
+    written = {}
+    for (store, month), rows in partitions.items():
+        dir_path = _partition_path(folder, platform, app_id, store, month)
+        os.makedirs(dir_path, exist_ok=True)
+        path = os.path.join(dir_path, _FILE_NAMES[fmt])
+        tmp_path = f"{path}.tmp"
+        if fmt == "parquet":
+            _write_parquet(tmp_path, rows)
+        else:
+            _write_jsonl(tmp_path, rows)
+        os.replace(tmp_path, path)
+        written[path] = len(rows)
+    return written
+
+def _matches(value, wanted) -> bool:
+    if wanted is None: return True
+    if isinstance(wanted, str): return value == _partition_value(wanted)
+    return value in {_partition_value(item) for item in wanted}
+
+def list_partitions(folder: str, platform=None, app_id=None, store=None, months=None) -> list:
+    # partition files matching the filters (a value or a list of values); only directory names are read
+    filters = [("platform", platform), ("app_id", app_id), ("store", store), ("month", months)]
+    paths = [folder]
+    for key, wanted in filters:
+        next_paths = []
+        for path in paths:
+            if not os.path.isdir(path): continue
+            for name in sorted(os.listdir(path)):
+                part_key, _, value = name.partition("=")
+                if part_key == key and _matches(value, wanted):
+                    next_paths.append(os.path.join(path, name))
+        paths = next_paths
+    files = []
+    for path in paths:
+        for fmt, file_name in _FILE_NAMES.items():
+            file_path = os.path.join(path, file_name)
+            if os.path.exists(file_path): files.append((fmt, file_path))
+    return files
+
+def _read_jsonl(path, columns):
+    with gzip.open(path, "rt", encoding="utf-8") as file:
+        for line in file:
+            if not line.strip(): continue
+            row = json.loads(line)
+            yield row if columns is None else {field: row.get(field) for field in columns}
+
+def _read_parquet(path, columns):
+    table = parquet.read_table(path, columns=list(columns) if columns else None, memory_map=True)
+    yield from table.to_pylist()
+
+def iter_reviews(folder: str, platform=None, app_id=None, store=None, months=None, columns=None):
+    # streams exported reviews partition by partition; `columns` limits the fields read
+    for fmt, path in list_partitions(folder, platform, app_id, store, months):
+        if fmt == "parquet":
+            check_format(fmt)
+            yield from _read_parquet(path, columns)
+        else:
+            yield from _read_jsonl(path, columns)
+
+def import_reviews(folder: str, platform=None, app_id=None, store=None, months=None, columns=None) -> list:
+    return list(iter_reviews(folder, platform, app_id, store, months, columns))
+
+def read_table(folder: str, platform=None, app_id=None, store=None, months=None, columns=None):
+    # parquet partitions as one memory mapped pyarrow Table
+    check_format("parquet")
+    tables = [parquet.read_table(path, columns=list(columns) if columns else None, memory_map=True)
+              for fmt, path in list_partitions(folder, platform, app_id, store, months) if fmt == "parquet"]
+    if not tables:
+        return pyarrow.table({field: [] for field in (columns or EXPORT_FIELDS)})
+    return pyarrow.concat_tables(tables)
+
+if __name__ == "__main__":
+    import sys
+    folder = sys.argv[1] if len(sys.argv) > 1 else os.path.join("temp", "export")
+    counts = {}
+    for review in iter_reviews(folder, columns=["store"]):
+        counts[review["store"]] = counts.get(review["store"], 0) + 1
+    print(json.dumps(counts, indent=2, ensure_ascii=False))
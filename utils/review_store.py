@@ -0,0 +1,88 @@
+import sqlite3, json, hashlib, threading, os
+
+# Local review history keyed by (platform, app_id, store/lang).
+# Feeds are sorted by most recent, so loaders stop paging at the first review already stored here.
+
+def review_key(review: dict) -> str:
+    raw = "\x1f".join(str(review.get(k, "")) for k in ("author", "date", "title", "content"))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+def take_new_reviews(reviews: list, known_keys: set):
+    # returns (reviews before the first known one, True if known review was reached)
+    if not known_keys: return reviews, False
+    for i, review in enumerate(reviews):
+        if review_key(review) in known_keys:
+            return reviews[:i], True
+    return reviews, False
+
+class ReviewStore:
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS reviews (
+                platform TEXT NOT NULL, app_id TEXT NOT NULL, store TEXT NOT NULL, key TEXT NOT NULL,
+                batch INTEGER NOT NULL, position INTEGER NOT NULL, data TEXT NOT NULL,
+                PRIMARY KEY (platform, app_id, store, key))""")
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS continuations (
+                platform TEXT NOT NULL, app_id TEXT NOT NULL, store TEXT NOT NULL, data TEXT NOT NULL,
+                PRIMARY KEY (platform, app_id, store))""")
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS version_analyses (
+                platform TEXT NOT NULL, app_id TEXT NOT NULL, version TEXT NOT NULL, fingerprint TEXT NOT NULL, data TEXT NOT NULL,
+                PRIMARY KEY (platform, app_id, version))""")
+
+    def known_keys(self, platform: str, app_id: str, store: str) -> set:
+        with self.lock:
+            rows = self.conn.execute("SELECT key FROM reviews WHERE platform=? AND app_id=? AND store=?",
+                                     (platform, app_id, store)).fetchall()
+        return {row[0] for row in rows}
+
+    def add_reviews(self, platform: str, app_id: str, store: str, reviews: list, older: bool = False) -> int:
+        # newest first order is kept: every call is a new batch placed before the previous ones,
+        # `older` batch (deeper history from a continuation token) goes after them
+        if not reviews: return 0
+        with self.lock, self.conn:
+            batch_query = "SELECT COALESCE(MIN(batch), 0) - 1" if older else "SELECT COALESCE(MAX(batch), 0) + 1"
+            batch = self.conn.execute(f"{batch_query} FROM reviews WHERE platform=? AND app_id=? AND store=?",
+                                      (platform, app_id, store)).fetchone()[0]
+            rows = [(platform, app_id, store, review_key(review), batch, position, json.dumps(review, ensure_ascii=False))
+                    for position, review in enumerate(reviews)]
+            before = self.conn.total_changes
+            self.conn.executemany("INSERT OR IGNORE INTO reviews VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            return self.conn.total_changes - before
+
+    def load_reviews(self, platform: str, app_id: str, store: str) -> list:
+        with self.lock:
+            rows = self.conn.execute("SELECT data FROM reviews WHERE platform=? AND app_id=? AND store=? ORDER BY batch DESC, position ASC",
+                                     (platform, app_id, store)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def get_continuation(self, platform: str, app_id: str, store: str):
+        # saved paging state to resume going deeper into history, None if never saved
+        with self.lock:
+            row = self.conn.execute("SELECT data FROM continuations WHERE platform=? AND app_id=? AND store=?",
+                                    (platform, app_id, store)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set_continuation(self, platform: str, app_id: str, store: str, state: dict):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO continuations VALUES (?, ?, ?, ?)",
+                              (platform, app_id, store, json.dumps(state)))
+
+    def get_version_analyses(self, platform: str, app_id: str) -> dict:
+        # version group -> (fingerprint of its reviews, analysis)
+        with self.lock:
+            rows = self.conn.execute("SELECT version, fingerprint, data FROM version_analyses WHERE platform=? AND app_id=?",
+                                     (platform, app_id)).fetchall()
+        return {version: (fingerprint, json.loads(data)) for version, fingerprint, data in rows}
+
+    def set_version_analysis(self, platform: str, app_id: str, version: str, fingerprint: str, analysis: dict):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO version_analyses VALUES (?, ?, ?, ?, ?)",
+                              (platform, app_id, version, fingerprint, json.dumps(analysis, ensure_ascii=False)))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,116 @@
+import sys
+from array import array
+from json.encoder import encode_basestring
+
+# Column oriented review storage: one list per field instead of one dict per review.
+# Repeated strings (version, store) are interned, sort/filter/take give index views over the same columns,
+# and the GPT payload is serialized straight from the columns.
+
+REVIEW_FIELDS = ("author", "date", "rating", "app_version", "title", "content", "usefull", "useless", "store", "cluster_size")
+# what GPT gets, in the order the loaders used to build review dicts
+PAYLOAD_FIELDS = ("rating", "app_version", "title", "content", "usefull", "useless", "cluster_size")
+_NUMBER_FIELDS = ("rating", "usefull", "useless", "cluster_size")
+_INTERNED_FIELDS = ("app_version", "store")
+
+class ReviewTable:
+    __slots__ = REVIEW_FIELDS
+
+    def __init__(self):
+        for field in REVIEW_FIELDS:
+            setattr(self, field, [])
+
+    @classmethod
+    def from_dicts(cls, reviews, store=None):
+        table = cls()
+        table.extend(reviews, store)
+        return table
+
+    def extend(self, reviews, store=None):
+        columns = [(field, getattr(self, field)) for field in REVIEW_FIELDS]
+        for review in reviews:
+            for field, column in columns:
+                value = review.get(field)
+                if field == "store" and value is None: value = store
+                if value is not None and field in _INTERNED_FIELDS: value = sys.intern(str(value))
+                column.append(value)
+
+    def __len__(self):
+        return len(self.content)
+
+    def view(self):
+        return ReviewView(self, range(len(self)))
+
+class Review:
+    # one row of a table, reads values from the columns on access
+    __slots__ = ("table", "index")
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    def get(self, field, default=None):
+        if field not in REVIEW_FIELDS: return default
+        value = getattr(self.table, field)[self.index]
+        return default if value is None else value
+
+    def __getitem__(self, field):
+        value = self.get(field)
+        if value is None: raise KeyError(field)
+        return value
+
+    def __contains__(self, field):
+        return self.get(field) is not None
+
+    def to_dict(self):
+        return {field: value for field in REVIEW_FIELDS if (value := self.get(field)) is not None}
+
+class ReviewView:
+    # ordered subset of table rows; never copies the columns
+    __slots__ = ("table", "indices")
+
+    def __init__(self, table, indices):
+        self.table = table
+        self.indices = indices
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __iter__(self):
+        table = self.table
+        return (Review(table, idx) for idx in self.indices)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return ReviewView(self.table, self.indices[position])
+        return Review(self.table, self.indices[position])
+
+    def sorted(self, key, reverse=False):
+        # `key` gets a row index, read the needed columns from `view.table`
+        return ReviewView(self.table, array("I", sorted(self.indices, key=key, reverse=reverse)))
+
+    def filter(self, predicate):
+        return ReviewView(self.table, array("I", (idx for idx in self.indices if predicate(idx))))
+
+    def take(self, positions):
+        indices = self.indices
+        return ReviewView(self.table, array("I", (indices[position] for position in positions)))
+
+    def to_dicts(self):
+        return [review.to_dict() for review in self]
+
+    def column(self, field):
+        values = getattr(self.table, field)
+        return [values[idx] for idx in self.indices]
+
+    def payload_texts(self, fields=PAYLOAD_FIELDS):
+        # compact JSON object per row, same text as json.dumps(review, ensure_ascii=False, separators=(',', ':'))
+        columns = [(f'"{field}":', getattr(self.table, field), field in _NUMBER_FIELDS) for field in fields]
+        texts = []
+        for idx in self.indices:
+            parts = []
+            for prefix, column, is_number in columns:
+                value = column[idx]
+                if value is None: continue
+                parts.append(prefix + (str(value) if is_number else encode_basestring(str(value))))
+            texts.append("{" + ",".join(parts) + "}")
+        return texts
@@ -0,0 +1,48 @@
+import gzip, json, os, shutil, threading
+
+# Per app checkpoints of stage outputs, so a crashed batch can go on with --resume:
+#   <folder>/<app_id>/info.json, reviews.json.gz, analysis.json.gz, sensortower.json, html.json
+# A stage with a checkpoint is not run again, its saved output is used instead.
+
+STAGES = ("info", "reviews", "analysis", "sensortower", "html")
+_COMPRESSED_STAGES = ("reviews", "analysis") # review lists get big
+
+class RunJournal:
+    def __init__(self, folder: str):
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+
+    def _app_folder(self, app_id: str) -> str:
+        return os.path.join(self.folder, app_id.replace(os.sep, "_"))
+
+    def _path(self, app_id: str, stage: str) -> str:
+        name = f"{stage}.json.gz" if stage in _COMPRESSED_STAGES else f"{stage}.json"
+        return os.path.join(self._app_folder(app_id), name)
+
+    def _open(self, path: str, stage: str, mode: str):
+        if stage in _COMPRESSED_STAGES:
+            return gzip.open(path, mode + "t", encoding="utf-8")
+        return open(path, mode, encoding="utf-8")
+
+    def load(self, app_id: str, stage: str):
+        # saved stage output or None
+        path = self._path(app_id, stage)
+        try:
+            with self._open(path, stage, "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None # no checkpoint or a half written one
+
+    def save(self, app_id: str, stage: str, value):
+        path = self._path(app_id, stage)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with self._open(tmp_path, stage, "w") as file:
+            json.dump(value, file, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    def completed_stages(self, app_id: str) -> list:
+        return [stage for stage in STAGES if os.path.exists(self._path(app_id, stage))]
+
+    def clear(self, app_id: str):
+        shutil.rmtree(self._app_folder(app_id), ignore_errors=True)
@@ -0,0 +1,87 @@
+import heapq, math
+from datetime import date as date_type
+
+# Stratified review order for the GPT payload.
+# Strata are rating x version (each of the latest versions alone, the rest as "older").
+# Every stratum gets a share ~ sqrt(size): small strata (short 5 star reviews) are not starved,
+# big ones still get more. Inside a stratum stores take turns and each store queue is ordered by
+# priority = vote ratio + recency + informativeness.
+# The result is a priority order; the token budget (select_reviews) decides where it is cut.
+
+LATEST_VERSIONS = 3
+RECENCY_HALF_LIFE_DAYS = 90
+INFORMATIVE_LENGTH = 400 # symbols after which a longer review is not more useful
+
+def _day_number(date) -> int:
+    # "2024-05-17" or "2024-05-17T10:00:00-07:00" -> days since epoch, None if unknown
+    try:
+        return date_type.fromisoformat(str(date)[:10]).toordinal()
+    except ValueError:
+        return None
+
+def _version_buckets(view) -> dict:
+    # version -> itself for the latest versions (by newest review date), "older" for the rest
+    table = view.table
+    versions, dates = table.app_version, table.date
+    newest = {}
+    for idx in view.indices:
+        version, date = versions[idx], str(dates[idx] or "")
+        if date > newest.get(version, ""): newest[version] = date
+    latest = sorted(newest, key=newest.get, reverse=True)[:LATEST_VERSIONS]
+    return {version: (version if version in latest else "older") for version in newest}
+
+def priority(review, today: int) -> float:
+    usefull = review.get("usefull", 0) or 0
+    useless = review.get("useless", 0) or 0
+    votes = math.log1p(usefull) - 0.5 * math.log1p(useless)
+    day = _day_number(review.get("date"))
+    recency = 0.5 ** (max(0, today - day) / RECENCY_HALF_LIFE_DAYS) if day else 0.0
+    length = len(review.get("content") or "") + len(review.get("title") or "")
+    return votes + recency + min(length, INFORMATIVE_LENGTH) / INFORMATIVE_LENGTH
+
+def stratum_of(review, version_buckets: dict) -> tuple:
+    return (review.get("rating"), version_buckets.get(review.get("app_version"), "older"))
+
+def stratified_order(view) -> list:
+    # positions of `view` in sampling order
+    version_buckets = _version_buckets(view)
+    days = [day for day in (_day_number(date) for date in view.column("date")) if day]
+    today = max(days) if days else 0 # relative to the newest review, so cached runs are reproducible
+
+    strata = {} # stratum -> store -> [(-priority, position)]
+    for position, review in enumerate(view):
+        stores = strata.setdefault(stratum_of(review, version_buckets), {})
+        stores.setdefault(review.get("store"), []).append((-priority(review, today), position))
+
+    queues = {}
+    for stratum, stores in strata.items():
+        store_queues = [sorted(items) for _, items in sorted(stores.items(), key=lambda item: str(item[0]))]
+        # stores take turns: 1st of every store, then 2nd of every store...
+        longest = max(len(queue) for queue in store_queues)
+        queues[stratum] = [queue[i][1] for i in range(longest) for queue in store_queues if i < len(queue)]
+
+    # stride scheduling: next pick from the stratum furthest below its sqrt(size) share
+    order = []
+    heap = [(0.0, str(stratum), stratum) for stratum in queues]
+    heapq.heapify(heap)
+    taken = {stratum: 0 for stratum in queues}
+    while heap:
+        _, key, stratum = heapq.heappop(heap)
+        queue = queues[stratum]
+        order.append(queue[taken[stratum]])
+        taken[stratum] += 1
+        if taken[stratum] < len(queue):
+            heapq.heappush(heap, (taken[stratum] / math.sqrt(len(queue)), key, stratum))
+    return order
+
+def stratum_coverage(all_reviews, selected_reviews) -> dict:
+    # "rating 5 / 1.2.0" -> {"selected": n, "total": n}, plus per store totals under "store us"
+    version_buckets = _version_buckets(all_reviews)
+    coverage = {}
+    for reviews, field in ((all_reviews, "total"), (selected_reviews, "selected")):
+        for review in reviews:
+            rating, version = stratum_of(review, version_buckets)
+            for key in (f"rating {rating} / {version}", f"store {review.get('store')}"):
+                entry = coverage.setdefault(key, {"selected": 0, "total": 0})
+                entry[field] += 1
+    return dict(sorted(coverage.items()))
@@ -1,9 +1,66 @@
-import requests, os
-from bs4 import BeautifulSoup
+import codecs, requests, os
+from html.parser import HTMLParser
+from urllib.parse import urlparse
+from utils import http_client, metadata_cache
+from utils.metrics import metrics
 
-def get_revenue_and_downloads(app_id: str):
-    url = f'https://app.sensortower.com/overview/{app_id}?country=US'
-    response = requests.get(url)
+# The overview page is large, but revenue and downloads are in <meta name="description"> of <head>.
+# The page is streamed into an incremental HTMLParser and the download stops once the tag
+# (or the end of <head>) is seen; only this head part is kept in the metadata cache.
+
+SENSORTOWER_URL = "https://app.sensortower.com/overview"
+CHUNK_SIZE = 4 * 1024
+MAX_HEAD_BYTES = 512 * 1024 # give up on pages without <head> end in sight
+
+class _MetaDescriptionParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.description = None
+        self.done = False
+
+    def handle_starttag(self, tag, attrs):
+        if self.done: return
+        if tag == "meta":
+            attrs = dict(attrs)
+            if (attrs.get("name") or "").lower() == "description":
+                self.description = attrs.get("content") or ""
+                self.done = True
+        elif tag == "body":
+            self.done = True
+
+    def handle_endtag(self, tag):
+        if tag == "head": self.done = True
+
+def _read_head(response) -> bytes:
+    # reads the streamed page up to the meta description, returns the bytes read
+    parser = _MetaDescriptionParser()
+    decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(errors="replace")
+    head = bytearray()
+    try:
+        for chunk in response.iter_content(CHUNK_SIZE):
+            head += chunk
+            parser.feed(decoder.decode(chunk))
+            if parser.done or len(head) >= MAX_HEAD_BYTES: break
+    finally:
+        response.close() # the rest of the page is not downloaded
+    metrics.incr("http_bytes", len(head), host=urlparse(response.url).netloc)
+    return bytes(head)
+
+def find_meta_description(html: str):
+    # content of <meta name="description"> of a page (or of its head part), None if missing
+    parser = _MetaDescriptionParser()
+    for start in range(0, len(html), CHUNK_SIZE):
+        parser.feed(html[start:start + CHUNK_SIZE])
+        if parser.done: break
+    return parser.description
+
+def get_revenue_and_downloads(app_id: str, base_url: str = SENSORTOWER_URL):
+    url = f'{base_url}/{app_id}?country=US'
+    try:
+        response = metadata_cache.get(url, read=_read_head, stream=True)
+    except requests.RequestException as e:
+        print(f"Failed to fetch the page: {e}")
+        return {"downloads":"-", "revenue": "-"}
 
     # Check if the request was successful
     if response.status_code == 200:
@@ -13,17 +70,13 @@ def get_revenue_and_downloads(app_id: str):
         return  {"downloads": downloads, "revenue": revenue}
     else:
         print(f"Failed to fetch the page. Status code: {response.status_code}")
+        response.close()
         return {"downloads":"-", "revenue": "-"}
 
 def _get_revenue_and_downloads(html: str):
-    # Parse the HTML content
-    soup = BeautifulSoup(html, 'html.parser')
-    
     # Find the relevant meta description content
-    meta_description = soup.find('meta', {'name': 'description'})
-    if meta_description:
-        content = meta_description.get('content', '')
-        
+    content = find_meta_description(html)
+    if content:
         # Look for the specific phrases in the content
         if 'downloads' in content and 'revenue' in content:
             try:
@@ -50,7 +103,7 @@ if __name__ == "__main__":
             html = file.read()
     else:
         url = 'https://app.sensortower.com/overview/284876795?country=US'
-        response = requests.get(url)
+        response = http_client.get(url)
         html = response.text
 
         # Check if the request was successful